@@ -1,5 +1,10 @@
 from .format import format, clean
-from .match import match, can_match
+from .match import match, can_match, compile
 from .simple import NoMatchException, format_simple # TODO: refactor other stuff to avoid using this directly
 from .symbol import S, TransSymbol, Nullable
 from .symbolic_address import SymbolicAddress
+from .batch import match_many, format_many
+from .explain import explain
+from .compose import compose
+from .codegen import codegen, invert
+from .aio import format_async, format_many_async
@@ -0,0 +1,146 @@
+from .format import format
+from .frozen import freeze
+from .lazy import distinct
+from .match import compile
+from .simple import NoMatchException
+from .symbol import start_collecting, stop_collecting
+
+# Async formatting, for TransSymbols whose transformations are lookups in some other service (code tables, address
+# normalization, ...). Give those an async `batch` function, from a list of values to the list of their transformed
+# values:
+#   >>> async def normalize(addresses): ...
+#   >>> template = {'address': TransSymbol(S('address'), batch=normalize), ...}
+#   >>> await format_async(template, match(match_template, record))
+# format_async formats as usual, except that batched transformations give a Pending placeholder instead of calling
+# anything, as do transformations of values with placeholders in them. Then the distinct values for each batch function
+# go to it in a single call (the calls for different functions run concurrently), and the results are filled in. That's
+# one call per batch function for the whole document, or a whole batch of them with format_many_async, rather than one
+# per value; more only where one batched transformation's output goes into another's.
+
+
+async def format_async(template, match_obj):
+    # Same as format(template, match_obj)
+    return (await format_many_async(template, None, [match_obj]))[0]
+
+
+async def format_many_async(template, match_template, records):
+    # Same as [format(template, match(match_template, record)) for record in records], except that, as in
+    # format_many, a record which doesn't match gives its NoMatchException in place of a result. Without a match
+    # template, records are Match objects (or whatever else format() takes).
+    compiled = compile(match_template) if match_template is not None else None
+    pending = Collector()
+    token = start_collecting(pending)
+    try:
+        results = []
+        for record in records:
+            try:
+                results.append(format(template, compiled.match(record) if compiled is not None else record))
+            except NoMatchException as e:
+                if compiled is None:
+                    raise
+                results.append(e)
+        await pending.run()
+    finally:
+        stop_collecting(token)
+    return [pending.fill(result) for result in results]
+
+
+class Pending(object):
+    # A transformed value which isn't known yet
+    __slots__ = ('trans', 'value', 'result', 'done')
+
+    def __init__(self, trans, value):
+        self.trans = trans
+        self.value = value  # The value to transform; may have other Pendings in it
+        self.result = None  # Once done; may have other Pendings in it, from transformations within transformations
+        self.done = False
+
+    def __repr__(self):
+        return 'Pending(' + repr(self.trans) + ', ' + repr(self.value) + ')'
+
+
+class Collector(object):
+    def __init__(self):
+        self.pending = []
+
+    def forward(self, trans, value):
+        # TransSymbol._forward, while formatting: puts off batched transformations, and anything depending on them
+        if trans._batch is None and not self.has_pending(value):
+            return trans._apply(value)
+        placeholder = Pending(trans, value)
+        self.pending.append(placeholder)
+        return placeholder
+
+    async def run(self):
+        # In rounds: everything whose value is known goes, so one call per batch function per round
+        import asyncio
+        while True:
+            waiting = [placeholder for placeholder in self.pending if not placeholder.done]
+            if not waiting:
+                return
+            ready = [placeholder for placeholder in waiting if self.ready(placeholder.value)]
+            batches = {}
+            for placeholder in ready:
+                value = self.fill(placeholder.value)
+                if placeholder.trans._batch is None:
+                    # A plain transformation, of something which had placeholders in it
+                    placeholder.result, placeholder.done = placeholder.trans._apply(value), True
+                else:
+                    batches.setdefault(placeholder.trans._batch, []).append((placeholder, value))
+            await asyncio.gather(*[self.run_batch(batch, items) for batch, items in batches.items()])
+
+    async def run_batch(self, batch, items):
+        # Each distinct value goes once. Values are only the same if they're of the same type too (str(1) != str(True)).
+        keys = [(type(value), value) for placeholder, value in items]
+        found = distinct(keys)
+        results = list(await batch([value for kind, value in found]))
+        if len(results) != len(found):
+            raise ValueError('%r returned %d results for %d values' % (batch, len(results), len(found)))
+        positions = {}
+        for position, key in enumerate(found):
+            try:
+                positions[freeze(key)] = position
+            except TypeError:
+                pass
+        for (placeholder, value), key in zip(items, keys):
+            try:
+                position = positions[freeze(key)]
+            except TypeError:
+                # Unhashable, even frozen
+                position = found.index(key)
+            placeholder.result, placeholder.done = results[position], True
+
+    def ready(self, value):
+        # Whether value's placeholders are all filled in
+        if type(value) == Pending:
+            return value.done and self.ready(value.result)
+        elif type(value) == dict:
+            return all(self.ready(v) for v in value.values())
+        elif type(value) in (list, tuple):
+            return all(self.ready(v) for v in value)
+        return True
+
+    def has_pending(self, value):
+        if type(value) == Pending:
+            return True
+        elif type(value) == dict:
+            return any(self.has_pending(v) for v in value.values())
+        elif type(value) in (list, tuple):
+            return any(self.has_pending(v) for v in value)
+        return False
+
+    def fill(self, value):
+        # value with its placeholders filled in. Containers are only copied if there's a placeholder somewhere inside
+        # them; formatted output shares the data's values, which shouldn't be copied (or changed).
+        if type(value) == Pending:
+            return self.fill(value.result)
+        elif type(value) == dict:
+            filled = {k: self.fill(v) for k, v in value.items()}
+            return value if all(filled[k] is v for k, v in value.items()) else filled
+        elif type(value) in (list, tuple):
+            filled = [self.fill(v) for v in value]
+            if all(a is b for a, b in zip(filled, value)):
+                return value
+            return filled if type(value) == list else tuple(filled)
+        return value
+
@@ -0,0 +1,68 @@
+from .symbol import Nullable, TransSymbol
+
+from collections import namedtuple
+from itertools import chain
+
+# Symbol analysis for templates. For a template node, in one walk over it (linear time, unlike adding up lists):
+#   symbols: every symbol in the node, in order (duplicates included), as get_symbols() always returned them
+#   singles: the symbols which are NOT inside any list
+#   nested: the symbols which ARE inside some list
+#   vectorized: the TransSymbols NOT inside any list with a vectorized function of a plain symbol (see format_multi)
+#   resolvable: the symbols whose class has a __resolve__ method, i.e. SymbolicAddresses (see resolve_symbols)
+# Nothing is cached here, since templates are plain dicts and lists which can change between calls. Callers which need
+# these for every row (e.g. format_multi) work them out once per call.
+Analysis = namedtuple('Analysis', ['symbols', 'singles', 'nested', 'vectorized', 'resolvable'])
+empty = Analysis((), (), (), (), ())
+
+
+def analyze(template):
+    if type(template) == TransSymbol:
+        inner = analyze(template._symbol)
+        if template._vectorized is not None and type(template._symbol) != TransSymbol and \
+                hasattr(template._symbol, '__substitute__'):
+            return inner._replace(vectorized=(template,))
+        return inner
+    elif hasattr(template, '__substitute__'):
+        resolvable = (template,) if hasattr(type(template), '__resolve__') else ()
+        return Analysis((template,), (template,), (), (), resolvable)
+    elif type(template) == list:
+        parts = [analyze(v) for v in template]
+        symbols = tuple(chain.from_iterable(part.symbols for part in parts))
+        return Analysis(symbols, (), symbols, (), tuple(chain.from_iterable(part.resolvable for part in parts)))
+    elif type(template) == dict:
+        parts = [analyze(v) for v in template.values()]
+        return Analysis(*(tuple(chain.from_iterable(fields)) for fields in zip(*parts))) if parts else empty
+    elif type(template) == Nullable:
+        return analyze(template.contents)
+    return empty
+
+
+def template_symbols(template):
+    return analyze(template).symbols
+
+
+def template_singles(template):
+    return analyze(template).singles
+
+
+def template_nested(template):
+    return analyze(template).nested
+
+
+def template_resolvable(template):
+    return analyze(template).resolvable
+
+
+def has_symbols(template):
+    # Same as bool(get_symbols(template)), but stops at the first symbol
+    if type(template) == TransSymbol:
+        return has_symbols(template._symbol)
+    if hasattr(template, '__substitute__'):
+        return True
+    if type(template) == list:
+        return any(has_symbols(v) for v in template)
+    if type(template) == dict:
+        return any(has_symbols(v) for v in template.values())
+    if type(template) == Nullable:
+        return has_symbols(template.contents)
+    return False
@@ -0,0 +1,109 @@
+from .format import format
+from .match import compile
+from .simple import NoMatchException
+
+from collections import deque, OrderedDict
+from itertools import islice
+import os, pickle, threading, uuid
+
+# Bulk matching/formatting for batches of records, e.g. a nightly export.
+# Templates are compiled once per worker process, records are sent over in chunks, and results come back in input order.
+# A record which doesn't match doesn't abort the batch: its NoMatchException is returned in place of its result.
+
+
+def match_many(template, records, max_workers=None, chunksize=100, executor=None):
+    # Equivalent to [list(match(template, record)) for record in records], as an iterator.
+    return _run_batch((template, None), records, max_workers, chunksize, executor)
+
+
+def format_many(template, match_template, records, max_workers=None, chunksize=100, executor=None):
+    # Equivalent to [format(template, match(match_template, record)) for record in records], as an iterator.
+    return _run_batch((match_template, template), records, max_workers, chunksize, executor)
+
+
+def _run_batch(templates, records, max_workers, chunksize, executor):
+    # max_workers=0 runs everything in this process (handy for templates which can't be pickled, e.g. ones using lambdas).
+    # Otherwise chunks go to `executor` if given, or else to a new ProcessPoolExecutor(max_workers).
+    chunks = _chunks(records, chunksize)
+    if max_workers == 0 and executor is None:
+        match_template, format_template = templates
+        compiled = compile(match_template)
+        for chunk in chunks:
+            for result in _run_chunk(compiled, format_template, chunk):
+                yield result
+        return
+
+    payload = (uuid.uuid4().hex, pickle.dumps(templates))
+    window = 4 * (max_workers or os.cpu_count() or 1)
+    if executor is not None:
+        results = _submit_all(executor, payload, chunks, window)
+    else:
+        results = _submit_all_to_new_pool(max_workers, payload, chunks, window)
+    for chunk_results in results:
+        for result in chunk_results:
+            yield result
+
+
+def _submit_all_to_new_pool(max_workers, payload, chunks, window):
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers) as executor:
+        for chunk_results in _submit_all(executor, payload, chunks, window):
+            yield chunk_results
+
+
+def _submit_all(executor, payload, chunks, window):
+    # Keep at most `window` chunks in flight, so memory stays bounded however many records there are
+    pending = deque()
+    for chunk in chunks:
+        pending.append(executor.submit(_worker, payload, chunk))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _chunks(records, chunksize):
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Compiled templates in each worker process, by batch, most recently used last. A few batches are kept, since several
+# can share an executor (and, with threads, run at the same time).
+_worker_templates = OrderedDict()
+_worker_lock = threading.Lock()
+MAX_WORKER_BATCHES = 8
+
+def _worker(payload, chunk):
+    token, templates = payload
+    with _worker_lock:
+        found = _worker_templates.get(token)
+        if found is not None:
+            _worker_templates.move_to_end(token)
+    if found is None:
+        match_template, format_template = pickle.loads(templates)
+        found = (compile(match_template), format_template)
+        with _worker_lock:
+            _worker_templates[token] = found
+            while len(_worker_templates) > MAX_WORKER_BATCHES:
+                _worker_templates.popitem(last=False)
+    compiled, format_template = found
+    return _run_chunk(compiled, format_template, chunk)
+
+
+def _run_chunk(compiled, format_template, chunk):
+    results = []
+    for record in chunk:
+        try:
+            if format_template is None:
+                results.append(compiled.match_simple(record))
+            else:
+                results.append(format(format_template, compiled.match(record)))
+        except NoMatchException as e:
+            # Exceptions have to make it back through pickle, and their args may be templates which can't be pickled.
+            # Same in-process, so results don't depend on max_workers.
+            results.append(NoMatchException(*[str(a) for a in e.args]))
+    return results
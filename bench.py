@@ -0,0 +1,220 @@
+from .codegen import codegen
+from .format import format
+from .match import compile, match
+from .merge import merge
+from .symbol import S, TransSymbol
+from .symbolic_address import SymbolicAddress
+
+import argparse, json, sys, time, tracemalloc
+
+# Benchmarks for each engine path, on synthetic workloads. Each case records the best wall time over a few runs, and the
+# peak memory (per tracemalloc) of one more run. Baselines can be saved and later runs compared against them:
+#   python -m regular.bench --save baseline.json
+#   python -m regular.bench --compare baseline.json
+# --scale makes every workload bigger or smaller (roughly linearly in the size of the data).
+
+
+# Workload generators. Each takes a scale factor, and returns a function which runs the workload once; setup (building
+# the templates and data) happens up front, so it isn't timed.
+
+def wide_dict(scale):
+    n = int(1000 * scale)
+    template = {'field' + str(i): S('f' + str(i)) for i in range(n)}
+    output = {'out' + str(i): S('f' + str(i)) for i in range(n)}
+    data = {'field' + str(i): i for i in range(n)}
+    return lambda: format(output, match(template, data))
+
+
+def deep_nesting(scale):
+    depth = int(200 * scale)
+    template, data = S('leaf'), 'value'
+    for i in range(depth):
+        template = {'level' + str(i): template, 'id' + str(i): S('id' + str(i))}
+        data = {'level' + str(i): data, 'id' + str(i): i}
+    compiled = compile(template)
+    return lambda: compiled.match_simple(data)
+
+
+def list_selectors(scale):
+    n = int(5000 * scale)
+    contacts = [{'type': 'borrower', 'name': 'name' + str(i), 'phone': str(i)} for i in range(n)]
+    contacts.insert(n // 2, {'type': 'contractor', 'name': 'bob', 'phone': '555'})
+    template = {'contacts': [{'type': 'contractor', 'name': S('name'), 'phone': S('phone')}]}
+    output = {'contractor': S('name'), 'phone': S('phone')}
+    data = {'contacts': contacts}
+    return lambda: format(output, match(template, data))
+
+
+def independent_lists(scale):
+    n = max(1, int(30 * scale))
+    template = {'u': [S('u')], 'v': [S('v')], 'w': [S('w')]}
+    data = {'u': list(range(n)), 'v': list(range(n)), 'w': list(range(n))}
+    return lambda: len(list(match(template, data)))
+
+
+def codegen_selectors(scale):
+    # list_selectors, plus a list in the output, through the generated code
+    n = int(5000 * scale)
+    contacts = [{'type': 'borrower', 'name': 'name' + str(i), 'phone': str(i)} for i in range(n)]
+    contacts.insert(n // 2, {'type': 'contractor', 'name': 'bob', 'phone': '555'})
+    template = {'contacts': [{'type': 'contractor', 'name': S('name'), 'phone': S('phone')},
+                             {'type': 'borrower', 'name': S('borrower')}]}
+    output = {'contractor': S('name'), 'phone': S('phone'), 'borrowers': [S('borrower')]}
+    data = {'contacts': contacts}
+    translate = codegen(template, output)
+    return lambda: translate(data)
+
+
+def join(scale):
+    n = int(2000 * scale)
+    template = {'names': [{'ssn': S('ssn'), 'name': S('name')}], 'hats': [{'ssn': S('ssn'), 'hat_color': S('color')}]}
+    output = [{'name': S('name'), 'color': S('color')}]
+    data = {'names': [{'ssn': i, 'name': 'name' + str(i)} for i in range(n)],
+            'hats': [{'ssn': i, 'hat_color': 'color' + str(i % 7)} for i in range(n)]}
+    return lambda: format(output, match(template, data))
+
+
+def nested_transpose(scale):
+    # people -> addresses, regrouped as states -> people
+    n = int(300 * scale)
+    states = ['state' + str(i) for i in range(20)]
+    people = [{'name': 'name' + str(i), 'addresses': [{'state': states[(i + j) % 20], 'city': 'city' + str(j)}
+                                                      for j in range(3)]} for i in range(n)]
+    template = [{'name': S('name'), 'addresses': [{'state': S('state'), 'city': S('city')}]}]
+    output = [{'state': S('state'), 'people': [{'name': S('name'), 'cities': [S('city')]}]}]
+    return lambda: format(output, match(template, people))
+
+
+def symbolic_addresses(scale):
+    n = int(300 * scale)
+    application = SymbolicAddress('application')
+    data = {'application': {'profile': {'field' + str(i): i for i in range(n)},
+                            'loans': [{'kind': 'primary', 'amount': 100}, {'kind': 'secondary', 'amount': 50}]}}
+    template = {'f' + str(i): getattr(application.profile, 'field' + str(i)) for i in range(n)}
+    template['primary'] = application.loans[{'kind': 'primary'}].amount
+    template['state'] = TransSymbol(application.profile.field0, str)
+    return lambda: format(template, data)
+
+
+def merge_large(scale):
+    n = int(2000 * scale)
+    source = {'loans': [{'id': i, 'status': 'closed'} for i in range(0, n, 10)], 'owner': {'name': 'bob'}}
+    def run():
+        target = {'loans': [{'id': i} for i in range(n)], 'owner': {}}
+        merge(source, target)
+        return target
+    return run
+
+
+def live_patch(scale):
+    # One field at a time changing in a big record, re-formatted after each change
+    n = int(2000 * scale)
+    data = {'loan': {'id': 1, 'amount': 100}, 'contacts': [{'type': 'borrower', 'name': 'name' + str(i), 'phone': str(i)}
+                                                           for i in range(n)]}
+    data['contacts'][0]['type'] = 'contractor'
+    template = {'loan': {'id': S('id'), 'amount': S('amount')},
+                'contacts': [{'type': 'contractor', 'name': S('name')}, {'name': S('any'), 'phone': S('phone')}]}
+    output = {'id': S('id'), 'contractor': S('name'), 'phones': [S('phone')]}
+    m = match(template, data)
+    m.patch('loan.amount', 200)
+    format(output, m)
+    runs = 0
+    def run():
+        # Every run (timed runs are repeated) changes the phones to something new, so none of the patches are no-ops
+        nonlocal runs
+        runs += 1
+        for i in range(0, n, max(1, n // 20)):
+            m.patch(['contacts', i, 'phone'], str(-i) + '-' + str(runs))
+            format(output, m)
+    return run
+
+
+workloads = [
+    ('wide_dict', wide_dict),
+    ('deep_nesting', deep_nesting),
+    ('list_selectors', list_selectors),
+    ('codegen_selectors', codegen_selectors),
+    ('independent_lists', independent_lists),
+    ('join', join),
+    ('nested_transpose', nested_transpose),
+    ('symbolic_addresses', symbolic_addresses),
+    ('merge_large', merge_large),
+    ('live_patch', live_patch),
+]
+
+
+def run_case(run, repeat=3):
+    # Best time of `repeat` runs, then the peak memory of one more run
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'time': min(times), 'peak': peak}
+
+
+def run_all(scale=1.0, repeat=3, only=None):
+    results = {}
+    for name, workload in workloads:
+        if only and name not in only:
+            continue
+        results[name] = run_case(workload(scale), repeat)
+    return results
+
+
+def compare(results, baseline, threshold=0.2):
+    # For each case in both: (name, time ratio, peak memory ratio, regressed), where a ratio over 1 means slower/bigger
+    # than the baseline, and regressed means either ratio is more than `threshold` over 1.
+    rows = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        time_ratio = result['time'] / old['time'] if old['time'] else 1.0
+        peak_ratio = result['peak'] / old['peak'] if old['peak'] else 1.0
+        rows.append((name, time_ratio, peak_ratio, max(time_ratio, peak_ratio) > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark Regular on synthetic workloads.')
+    parser.add_argument('cases', nargs='*', help='workloads to run (default: all of ' +
+                        ', '.join(name for name, workload in workloads) + ')')
+    parser.add_argument('--scale', type=float, default=1.0, help='size multiplier for every workload')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case; the best one counts')
+    parser.add_argument('--save', help='write the results to this file, as a baseline')
+    parser.add_argument('--compare', help='compare against a baseline saved with --save')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown counted as a regression (0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    results = run_all(args.scale, args.repeat, args.cases)
+    for name, result in results.items():
+        print('%-20s %10.2f ms %10.1f KiB' % (name, result['time'] * 1000, result['peak'] / 1024.0))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'scale': args.scale, 'results': results}, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != args.scale:
+            sys.stderr.write('warning: baseline was run with --scale %s\n' % baseline.get('scale'))
+        rows = compare(results, baseline['results'], args.threshold)
+        print('')
+        for name, time_ratio, peak_ratio, regressed in rows:
+            print('%-20s time x%.2f  peak x%.2f%s' % (name, time_ratio, peak_ratio, '  REGRESSION' if regressed else ''))
+        if any(row[3] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
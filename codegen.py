@@ -0,0 +1,521 @@
+from .analysis import has_symbols, template_singles, template_symbols
+from .format import format
+from .frozen import freeze
+from .match import compile
+from .simple import NoMatchException, get_default
+from .symbol import Nullable, S, TransSymbol
+
+import builtins, linecache, re, sys
+
+# Code generation for a (match template, format template) pair: codegen(match_template, format_template) writes a
+# Python function specialized to the two templates, which does the same as format(format_template, match(match_template,
+# data)) with plain dict lookups and loops, and none of the generic machinery (nodes, products, indexes) in between.
+#   >>> translate = codegen(los_template, encompass_template)
+#   >>> translate(record)
+#   >>> print(translate.source)
+# The generated code only handles data which matches the usual way: as soon as anything unusual turns up (the data
+# doesn't match, a Nullable part fails, a list element matches nothing), it hands the record to the engine instead, so
+# results (and exceptions) are always the same as the engine's. Template pairs it can't handle at all fall back to the
+# engine for every record (see translator.specialized and translator.reason):
+#   - symbols other than S
+#   - joins, i.e. symbols used by the format template which appear more than once in the match template
+#   - lists inside lists in the match template
+#   - lists in the format template whose elements need symbols from two different lists of the match template
+#   - vectorized TransSymbols (which the engine calls once per list)
+# Matching a list gives a list of rows (one tuple of values per matching element); lists in the format template loop
+# over the rows of the list their symbols come from, skipping rows which don't agree with the values already bound, and
+# duplicates, just as format() does.
+# invert(match_template, format_template) is the same thing the other way round, for reverse mappings: it matches
+# format_template (applying TransSymbols' reverse functions, as the engine does), and formats match_template.
+
+REFERENCE = '_reference(data)'
+
+
+def codegen(match_template, format_template):
+    return Translator(match_template, format_template)
+
+
+def invert(match_template, format_template):
+    # Reverse of codegen(match_template, format_template): same as format(match_template, match(format_template, data))
+    return Translator(format_template, match_template)
+
+
+class Unsupported(Exception):
+    pass
+
+
+class Translator(object):
+    count = 0  # For the file names of generated code
+
+    def __init__(self, match_template, format_template):
+        self.match_template = compile(match_template)
+        self.format_template = format_template
+        try:
+            generator = Generator(self.match_template.template, format_template)
+            self.source = generator.generate()
+            namespace = generator.constants
+            self.specialized, self.reason = True, None
+        except Unsupported as e:
+            self.source = 'def translate(data):\n    # Not specialized: %s\n    return %s\n' % (e, REFERENCE)
+            namespace = {}
+            self.specialized, self.reason = False, str(e)
+        namespace.update(_reference=self.reference, _get=get_default, _freeze_key=freeze_key, _freeze_row=freeze_row,
+                         _partial_trans=partial_trans, _partial_nullable=partial_nullable,
+                         NoMatchException=NoMatchException)
+
+        # Registered with linecache, so tracebacks through the generated code show its source
+        Translator.count += 1
+        filename = '<regular.codegen-%d>' % Translator.count
+        linecache.cache[filename] = (len(self.source), None, self.source.splitlines(True), filename)
+        # (builtins.compile, since match.compile is imported here)
+        exec(builtins.compile(self.source, filename, 'exec'), namespace)
+        self.function = namespace['translate']
+
+    def __call__(self, data):
+        return self.function(data)
+
+    def reference(self, data):
+        return format(self.format_template, self.match_template.match(data))
+
+    def dump(self, file=None):
+        (file or sys.stdout).write(self.source)
+
+    def __repr__(self):
+        return 'codegen(' + repr(self.match_template.template) + ', ' + repr(self.format_template) + ')'
+
+
+class Unhashable(object):
+    # Stands in for a row of the output which can't be frozen (see frozen.py); compared by value, like unique() does
+    def __init__(self, value):
+        self.value = value
+
+    def __hash__(self):
+        return 0
+
+    def __eq__(self, other):
+        return type(other) == Unhashable and self.value == other.value
+
+
+def freeze_key(value):
+    try:
+        return freeze(value)
+    except TypeError:
+        return Unhashable(value)
+
+
+def freeze_row(row):
+    try:
+        return tuple(freeze(v) for v in row)
+    except TypeError:
+        return Unhashable(row)
+
+
+# Same as format_simple_single for TransSymbols and Nullables whose contents (already formatted) may still have symbols
+# in them, i.e. ones the match template doesn't have
+
+def partial_trans(template, result):
+    if not has_symbols(result):
+        return template._forward(result)
+    return TransSymbol(result, template._forward, template._reverse, vectorized=template._vectorized)
+
+
+def partial_nullable(result):
+    if has_symbols(result):
+        return Nullable(result)
+    return result
+
+
+class Generator(object):
+    def __init__(self, match_template, format_template):
+        self.match_template = match_template
+        self.format_template = format_template
+        self.lines = []
+        self.depth = 1
+        self.counts = {}  # Prefix -> number of temporaries so far
+        self.constants = {}  # Name -> value, for the generated code's globals
+        self.constant_names = {}  # id(value) -> name
+        self.relevance = {}  # id(template) -> whether matching it does anything (see relevant())
+        self.forwards = {}  # id(TransSymbol) -> name of its forward function
+        # format_simple_single takes the value of a TransSymbol from the match, if it's the same object, but only in the
+        # first pass over each part of the format template; after that it's a copy (see substituted())
+        self.first_pass = set(id(trans) for trans in first_pass(format_template))
+
+        # Only the symbols the format template asks for are matched (as in format(), which only asks for those)
+        for symbol in template_symbols(format_template):
+            if type(symbol) != S:
+                raise Unsupported('symbols other than S in the format template')
+        self.used = frozenset(template_symbols(format_template))
+        matched = [symbol for symbol in template_symbols(match_template) if symbol in self.used]
+        if len(set(matched)) != len(matched):
+            raise Unsupported('joins')
+        # Symbols the match template doesn't have are left as they are, as format() leaves them
+        self.known = frozenset(matched)
+        self.variables = {symbol: 's%d_%s' % (i, re.sub(r'\W', '_', str.__str__(symbol))[:20])
+                          for i, symbol in enumerate(matched)}
+        # TransSymbols in the match template bind the data they match as well, so rows have them as members too. For
+        # each one we need: the symbols inside it which we need.
+        self.transforms = {}
+        self.groups = []  # For each list element template with symbols: (rows variable, its members)
+        self.group_of = {}  # Member -> (index into groups, position in the rows)
+
+    def generate(self):
+        self.emit('def translate(data):', 0)
+        self.emit('# match: ' + repr(self.match_template))
+        self.emit('# format: ' + repr(self.format_template))
+        self.match(self.match_template, 'data', 'return ' + REFERENCE, False)
+        if type(self.format_template) == list:
+            self.emit('return ' + self.format_list(self.format_template, frozenset(), {}))
+        else:
+            # Symbols outside lists take their values from the first match, as in format_multi
+            singles = [symbol for symbol in unique_symbols(template_singles(self.format_template))
+                       if symbol in self.known]
+            members = singles + self.bound_transforms(self.transforms, singles)
+            bound = frozenset(members)
+            for member in members:
+                if member in self.group_of:
+                    index, position = self.group_of[member]
+                    self.emit('%s = %s[0][%d]' % (self.variables[member], self.groups[index][0], position))
+            hoisted = {}
+            self.hoist(self.format_template, bound, hoisted, False)
+            self.emit('return ' + self.expression(self.format_template, bound, hoisted))
+        return '\n'.join(self.lines) + '\n'
+
+    # Helpers for writing code
+
+    def emit(self, line, depth=None):
+        self.lines.append('    ' * (self.depth if depth is None else depth) + line)
+
+    def temporary(self, prefix):
+        n = self.counts.get(prefix, 0)
+        self.counts[prefix] = n + 1
+        return prefix + str(n)
+
+    def constant(self, value, prefix='c'):
+        name = self.constant_names.get(id(value))
+        if name is None:
+            name = self.constant_names[id(value)] = '_' + self.temporary(prefix)
+            self.constants[name] = value
+        return name
+
+    def forward(self, trans):
+        # trans._forward, looked up once (templates hold on to their TransSymbols, so ids can't be reused)
+        name = self.forwards.get(id(trans))
+        if name is None:
+            if trans._vectorized is not None:
+                # The engine makes one call per list; generated code would make one per value
+                raise Unsupported('vectorized TransSymbols')
+            name = self.forwards[id(trans)] = self.constant(trans._forward, 'f')
+        return name
+
+    def literal(self, value):
+        if type(value) in (str, bytes, int, bool, type(None)) or (type(value) == float and value == value and
+                                                                  abs(value) != float('inf')):
+            return repr(value)
+        # Anything else goes in by reference, as it does in format's output
+        return self.constant(value)
+
+    # Matching. Each part of the match template is matched against a variable; `fail` is the statement to run if the
+    # data doesn't match, and in_list says whether we're inside a list element.
+
+    def relevant(self, template):
+        # Whether matching template binds any symbols we need, or can fail
+        cached = self.relevance.get(id(template))
+        if cached is not None:
+            return cached[1]
+        if type(template) in (TransSymbol, Nullable) or hasattr(template, '__substitute__'):
+            result = any(symbol in self.used for symbol in template_symbols(template))
+        elif type(template) == dict:
+            result = any(self.relevant(value) for value in template.values())
+        else:
+            # Literals, and lists (which need at least one element to match)
+            result = True
+        self.relevance[id(template)] = (template, result)
+        return result
+
+    def match(self, template, var, fail, in_list):
+        if not self.relevant(template):
+            return
+        if type(template) == S:
+            self.emit('%s = %s' % (self.variables[template], var))
+        elif type(template) == TransSymbol:
+            self.match_trans(template, var, fail, in_list)
+        elif hasattr(template, '__substitute__'):
+            raise Unsupported('symbols other than S in the match template')
+        elif type(template) == Nullable:
+            # Inside a list, a Nullable part which doesn't match would leave a row without some symbols; the engine
+            # handles those. Outside lists, the engine handles anything which doesn't match anyway.
+            self.match(template.contents, var, 'return ' + REFERENCE, in_list)
+        elif type(template) == dict:
+            self.match_dict(template, var, fail, in_list)
+        elif type(template) == list:
+            if in_list:
+                raise Unsupported('lists inside lists in the match template')
+            # Same xml hack as the engine: data which isn't list-like is treated as a single-element list
+            items = self.temporary('d')
+            self.emit('%s = %s if type(%s) in (list, tuple) else [%s]' % (items, var, var, var))
+            for element in template:
+                self.match_element(element, items)
+        else:
+            self.emit('if %s != %s:' % (self.literal(template), var))
+            self.emit(fail, self.depth + 1)
+
+    def match_dict(self, template, var, fail, in_list):
+        items = [(key, value) for key, value in template.items() if self.relevant(value)]
+        targets = [self.variables[value] if type(value) == S else self.temporary('d') for key, value in items]
+        lookups = []
+        for key, value in items:
+            if type(key) == str and hasattr(dict, key):
+                # get_default falls back to attributes, and dicts have this one
+                lookups.append(('_get(%s, %s)' % (var, repr(key)),) * 2)
+            else:
+                lookups.append(('%s.get(%s)' % (var, self.literal(key)), '_get(%s, %s)' % (var, self.literal(key))))
+        if len(items) == 1:
+            self.emit('%s = %s if type(%s) == dict else %s' % (targets[0], lookups[0][0], var, lookups[0][1]))
+        elif items:
+            self.emit('if type(%s) == dict:' % var)
+            for target, lookup in zip(targets, lookups):
+                self.emit('%s = %s' % (target, lookup[0]), self.depth + 1)
+            self.emit('else:')
+            for target, lookup in zip(targets, lookups):
+                self.emit('%s = %s' % (target, lookup[1]), self.depth + 1)
+        for (key, value), target in zip(items, targets):
+            if type(value) != S:
+                self.match(value, target, fail, in_list)
+
+    def match_trans(self, template, var, fail, in_list):
+        # As in the engine: the TransSymbol binds the data, and what's inside it is matched against the reverse
+        if template in self.transforms:
+            raise Unsupported('joins')
+        self.transforms[template] = frozenset(symbol for symbol in template_symbols(template) if symbol in self.used)
+        variable = self.variables[template] = self.temporary('v')
+        self.emit('%s = %s' % (variable, var))
+        inner = template._symbol
+        target = self.variables[inner] if type(inner) == S else self.temporary('d')
+        if type(template._map) == dict and template._reverse == template._map_reverse:
+            self.emit('%s = %s.get(%s)' % (target, self.constant(template._reverse_map, 'm'), variable))
+        else:
+            # Reverse functions can reject data with NoMatchException; the engine deals with that
+            self.emit('try:')
+            self.emit('%s = %s(%s)' % (target, self.constant(template._reverse, 'r'), variable), self.depth + 1)
+            self.emit('except NoMatchException:')
+            self.emit('return ' + REFERENCE, self.depth + 1)
+        if type(inner) != S:
+            self.match(inner, target, fail, in_list)
+
+    def members(self, template):
+        # What matching template binds (of what we need), in order: symbols, and TransSymbols with symbols inside
+        if not self.relevant(template):
+            return []
+        if type(template) == S:
+            return [template]
+        elif type(template) == TransSymbol:
+            return [template] + self.members(template._symbol)
+        elif type(template) == Nullable:
+            return self.members(template.contents)
+        elif type(template) == dict:
+            return [member for value in template.values() for member in self.members(value)]
+        elif type(template) == list:
+            return [member for element in template for member in self.members(element)]
+        return []
+
+    def bound_transforms(self, candidates, symbols):
+        # The TransSymbols among candidates which the engine binds along with symbols: those with any of them inside
+        symbols = frozenset(symbol for symbol in symbols if type(symbol) == S)
+        return [member for member in candidates if type(member) == TransSymbol and
+                not self.transforms[member].isdisjoint(symbols)]
+
+    def match_element(self, element, var):
+        # One element template of a list. A Nullable around the whole element makes no difference here: elements which
+        # don't match are skipped either way, and if none match, the engine gets the record.
+        while type(element) == Nullable:
+            element = element.contents
+        candidate = self.temporary('d')
+        members = self.members(element)
+        if members:
+            rows = self.temporary('rows')
+            for position, member in enumerate(members):
+                self.group_of[member] = (len(self.groups), position)
+            self.groups.append((rows, members))
+            self.emit('%s = []' % rows)
+            self.emit('for %s in %s:' % (candidate, var))
+            self.depth += 1
+            self.match(element, candidate, 'continue', True)
+            self.emit('%s.append((%s,))' % (rows, ', '.join(self.variables[member] for member in members)))
+            self.depth -= 1
+            self.emit('if not %s:' % rows)
+        elif self.relevant(element):
+            # Only needs one element which matches
+            self.emit('for %s in %s:' % (candidate, var))
+            self.depth += 1
+            self.match(element, candidate, 'continue', True)
+            self.emit('break')
+            self.depth -= 1
+            self.emit('else:')
+        else:
+            self.emit('if not %s:' % var)
+        self.emit('return ' + REFERENCE, self.depth + 1)
+
+    # Formatting. `bound` is the set of symbols with values at this point (in their variables), and `hoisted` maps the
+    # ids of TransSymbols which have already been computed to the variables holding them.
+
+    def expression(self, template, bound, hoisted):
+        if id(template) in hoisted:
+            return hoisted[id(template)]
+        if type(template) == S:
+            return self.variables[template] if template in self.known else self.constant(template)
+        elif type(template) == TransSymbol:
+            if self.substituted(template, bound):
+                return self.variables[template]
+            inner = self.expression(template._symbol, bound, hoisted)
+            if self.unknown(template):
+                return '_partial_trans(%s, %s)' % (self.constant(template), inner)
+            return '%s(%s)' % (self.forward(template), inner)
+        elif type(template) == Nullable:
+            # With all the symbols inside it bound, there's nothing for the Nullable to do
+            inner = self.expression(template.contents, bound, hoisted)
+            if self.unknown(template):
+                return '_partial_nullable(%s)' % inner
+            return inner
+        elif type(template) == dict:
+            return '{' + ', '.join('%s: %s' % (self.literal(key), self.expression(value, bound, hoisted))
+                                   for key, value in template.items()) + '}'
+        elif type(template) == list:
+            return self.format_list(template, bound, hoisted)
+        return self.literal(template)
+
+    def substituted(self, trans, bound):
+        # Whether the output has trans's value from the match, rather than its forward function applied
+        return id(trans) in self.first_pass and trans in bound
+
+    def unknown(self, template):
+        # Whether template has symbols the match template doesn't
+        return any(symbol not in self.known for symbol in template_symbols(template))
+
+    def hoist(self, template, bound, hoisted, in_list):
+        # format_multi substitutes everything it can into the whole template, lists included, before formatting the
+        # lists; so TransSymbols inside lists whose symbols are all bound here are computed here, once.
+        if type(template) == TransSymbol:
+            if self.substituted(template, bound):
+                return
+            if in_list and id(template) not in hoisted and bound.issuperset(template_symbols(template)):
+                expression = self.expression(template, bound, hoisted)
+                hoisted[id(template)] = self.temporary('t')
+                self.emit('%s = %s' % (hoisted[id(template)], expression))
+            else:
+                self.hoist(template._symbol, bound, hoisted, in_list)
+        elif type(template) == Nullable:
+            self.hoist(template.contents, bound, hoisted, in_list)
+        elif type(template) == dict:
+            for value in template.values():
+                self.hoist(value, bound, hoisted, in_list)
+        elif type(template) == list:
+            for element in template:
+                self.hoist(element, bound, hoisted, True)
+
+    def format_list(self, template, bound, hoisted):
+        # Same as format_lists: each element template gives one element per combination of values of its symbols
+        result = self.temporary('l')
+        self.emit('%s = []' % result)
+        for element in template:
+            if not has_trans(element):
+                self.format_element(element, bound, hoisted, result)
+                continue
+            # A transformation raising NoMatchException drops this element template's output, as in format_lists
+            part = self.temporary('p')
+            self.emit('try:')
+            self.depth += 1
+            self.emit('%s = []' % part)
+            self.format_element(element, bound, hoisted, part)
+            self.emit('%s += %s' % (result, part))
+            self.depth -= 1
+            self.emit('except NoMatchException:')
+            self.emit('pass', self.depth + 1)
+        return result
+
+    def format_element(self, element, bound, hoisted, result):
+        free = [symbol for symbol in unique_symbols(template_singles(element))
+                if symbol in self.known and symbol not in bound]
+        groups = set(self.group_of[symbol][0] for symbol in free if symbol in self.group_of)
+        if len(groups) > 1:
+            raise Unsupported('list elements in the format template with symbols from two lists of the match template')
+        requested = bound.union(free)
+        top = [member for member in self.transforms if member not in self.group_of]
+        inner = requested.union(self.bound_transforms(top, requested))
+        hoisted = dict(hoisted)
+        if not groups:
+            # Symbols from outside lists only (or none at all): one element
+            self.hoist(element, inner, hoisted, False)
+            self.emit('%s.append(%s)' % (result, self.expression(element, inner, hoisted)))
+            return
+
+        index = groups.pop()
+        rows, members = self.groups[index]
+        # TransSymbols come along with the symbols inside them, and count towards duplicates
+        projected = [symbol for symbol in free if symbol in self.group_of]
+        projected += [member for member in self.bound_transforms(members, requested) if member not in bound]
+        inner = inner.union(projected)
+        row, seen = self.temporary('r'), self.temporary('seen')
+        positions = [self.group_of[member][1] for member in projected]
+        self.emit('%s = set()' % seen)
+        self.emit('for %s in %s:' % (row, rows))
+        self.depth += 1
+        # Rows have to agree with the values already bound from the same list
+        for member in members:
+            if member in bound:
+                self.emit('if %s[%d] != %s:' % (row, self.group_of[member][1], self.variables[member]))
+                self.emit('continue', self.depth + 1)
+        # Skip duplicates, as unique() does
+        if len(positions) == 1:
+            key, freezer = '%s[%d]' % (row, positions[0]), '_freeze_key'
+        else:
+            key, freezer = '(%s,)' % ', '.join('%s[%d]' % (row, p) for p in positions), '_freeze_row'
+        self.emit('k = ' + key)
+        self.emit('try:')
+        self.emit('if k in %s:' % seen, self.depth + 1)
+        self.emit('continue', self.depth + 2)
+        self.emit('%s.add(k)' % seen, self.depth + 1)
+        self.emit('except TypeError:')
+        self.emit('k = %s(k)' % freezer, self.depth + 1)
+        self.emit('if k in %s:' % seen, self.depth + 1)
+        self.emit('continue', self.depth + 2)
+        self.emit('%s.add(k)' % seen, self.depth + 1)
+        for member in projected:
+            self.emit('%s = %s[%d]' % (self.variables[member], row, self.group_of[member][1]))
+        self.hoist(element, inner, hoisted, False)
+        self.emit('%s.append(%s)' % (result, self.expression(element, inner, hoisted)))
+        self.depth -= 1
+
+
+def unique_symbols(symbols):
+    seen = set()
+    return [symbol for symbol in symbols if not (symbol in seen or seen.add(symbol))]
+
+
+def first_pass(template):
+    # TransSymbols in the format template which the first format_multi to reach them sees as they are: the ones outside
+    # lists, or inside a single list at the top
+    if type(template) == list:
+        return [trans for element in template for trans in outside_lists(element)]
+    return outside_lists(template)
+
+
+def outside_lists(template):
+    if type(template) == TransSymbol:
+        return [template] + outside_lists(template._symbol)
+    elif type(template) == Nullable:
+        return outside_lists(template.contents)
+    elif type(template) == dict:
+        return [trans for value in template.values() for trans in outside_lists(value)]
+    return []
+
+
+def has_trans(template):
+    if type(template) == TransSymbol:
+        return True
+    elif type(template) == Nullable:
+        return has_trans(template.contents)
+    elif type(template) == dict:
+        return any(has_trans(value) for value in template.values())
+    elif type(template) == list:
+        return any(has_trans(element) for element in template)
+    return False
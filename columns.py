@@ -0,0 +1,199 @@
+from .frozen import freeze
+from .join import MISSING
+from .lazy import iter_rows, project, schema
+
+
+# Columnar match results, for big lists of homogeneous records: one column per symbol rather than one dict per match.
+# Columns of all ints, all floats or all bools are numpy arrays when numpy is installed; anything else is a plain list.
+# Filters and joins work on whole columns: they compute which rows to keep, then gather every column at once.
+#   >>> people = match([{'name': S('name'), 'age': S('age')}], data).to_columns()
+#   >>> adults = people.filter(people[S('age')] >= 18)
+# numpy takes a while to import, so it's only imported the first time a column could be an array (see load_numpy).
+
+numpy = None
+numpy_loaded = False
+
+
+def load_numpy():
+    # numpy, or None if it isn't installed
+    global numpy, numpy_loaded
+    if not numpy_loaded:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy, numpy_loaded = module, True
+    return numpy
+
+
+class Columns(object):
+    def __init__(self, columns, schema, length, use_numpy=True):
+        self.columns = columns  # symbol -> column
+        self.schema = schema  # The symbols, in order
+        self.length = length
+        self.use_numpy = use_numpy
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, symbol):
+        return self.columns[symbol]
+
+    def __contains__(self, symbol):
+        return symbol in self.columns
+
+    def __iter__(self):
+        # Back to one dict per match (with None for symbols a match didn't bind)
+        if not self.schema:
+            for i in range(self.length):
+                yield {}
+            return
+        for values in zip(*[to_list(self.columns[symbol]) for symbol in self.schema]):
+            yield dict(zip(self.schema, values))
+
+    def __repr__(self):
+        return 'Columns(' + repr(self.columns) + ')'
+
+    def take(self, positions):
+        # The rows at the given positions, in that order
+        return Columns({symbol: take(column, positions) for symbol, column in self.columns.items()}, self.schema,
+                       len(positions), self.use_numpy)
+
+    def filter(self, mask):
+        # The rows where mask (a sequence of bools, one per row, e.g. people[S('age')] >= 18) is true
+        numpy = load_numpy()
+        if numpy is not None:
+            return self.take(numpy.flatnonzero(numpy.asarray(mask, dtype=bool)))
+        return self.take([i for i, keep in enumerate(mask) if keep])
+
+    def join(self, other, on=None):
+        # Inner join, on the given symbols (by default, all the symbols the two have in common). Rows come out in the
+        # order of the nested loop over self then other, as in a match; each row has the symbols of both.
+        if on is None:
+            on = [symbol for symbol in self.schema if symbol in other.columns]
+        left, right = join_positions([self.columns[symbol] for symbol in on], self.length,
+                                     [other.columns[symbol] for symbol in on], other.length)
+        columns = {symbol: take(column, left) for symbol, column in self.columns.items()}
+        extra = [symbol for symbol in other.schema if symbol not in self.columns]
+        for symbol in extra:
+            columns[symbol] = take(other.columns[symbol], right)
+        return Columns(columns, self.schema + tuple(extra), len(left), self.use_numpy)
+
+    def apply(self, trans):
+        # Adds the column for a TransSymbol over one of the symbols here, i.e. trans's forward function over that
+        # whole column, or its vectorized function (see TransSymbol) on the column itself.
+        if trans._vectorized is not None:
+            values = trans._vectorize(self.columns[trans._symbol])
+        else:
+            values = [trans._forward(v) for v in to_list(self.columns[trans._symbol])]
+        columns = dict(self.columns)
+        columns[trans] = column(values, self.use_numpy)
+        return Columns(columns, self.schema + (trans,), self.length, self.use_numpy)
+
+
+def to_columns(result, symbols=None, use_numpy=True):
+    # Columns for a match result (see lazy.py), optionally restricted to some symbols. Missing values are None.
+    if symbols is not None:
+        result = project(result, symbols)
+    result_schema = schema(result)
+    rows = list(iter_rows(result, result_schema))
+    if result_schema:
+        lists = [list(values) for values in zip(*rows)] if rows else [[] for symbol in result_schema]
+    else:
+        lists = []
+    columns = {symbol: column([None if v is MISSING else v for v in values], use_numpy)
+               for symbol, values in zip(result_schema, lists)}
+    return Columns(columns, result_schema, len(rows), use_numpy)
+
+
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def column(values, use_numpy=True):
+    # A numpy array if the values are all bools, all ints (within int64) or all floats, and numpy is around; otherwise
+    # the list itself. Anything mixed stays a list, since an array would change some values (e.g. ints to floats), and
+    # iterating the columns has to give back exactly what the match did.
+    if not use_numpy or not values:
+        return values
+    kind = type(values[0])
+    if kind not in (bool, int, float) or any(type(v) != kind for v in values):
+        return values
+    if kind == int and not all(INT64_MIN <= v <= INT64_MAX for v in values):
+        return values
+    numpy = load_numpy()
+    if numpy is None:
+        return values
+    return numpy.array(values, dtype={bool: bool, int: numpy.int64, float: numpy.float64}[kind])
+
+
+def to_list(column):
+    if type(column) == list:
+        return column
+    return column.tolist()
+
+
+def take(column, positions):
+    if type(column) == list:
+        return [column[p] for p in positions]
+    return column[numpy.asarray(positions, dtype=numpy.intp)]
+
+
+def join_positions(left_keys, left_length, right_keys, right_length):
+    # Positions of the matching rows in the left and right columns, in nested loop order
+    if not left_keys:
+        # Nothing in common: cartesian product
+        numpy = load_numpy()
+        if numpy is not None:
+            return (numpy.repeat(numpy.arange(left_length), right_length),
+                    numpy.tile(numpy.arange(right_length), left_length))
+        return ([i for i in range(left_length) for j in range(right_length)],
+                [j for i in range(left_length) for j in range(right_length)])
+    if len(left_keys) == 1 and numeric(left_keys[0]) and numeric(right_keys[0]):
+        return sorted_join_positions(left_keys[0], right_keys[0])
+    return hash_join_positions(left_keys, left_length, right_keys, right_length)
+
+
+def numeric(column):
+    return type(column) != list and column.dtype.kind in 'biuf'
+
+
+def sorted_join_positions(left, right):
+    # Vectorized equi-join of two numeric columns: sort the right side, and find each left value's run in it
+    order = numpy.argsort(right, kind='stable')
+    ordered = right[order]
+    starts = numpy.searchsorted(ordered, left, 'left')
+    counts = numpy.searchsorted(ordered, left, 'right') - starts
+    if left.dtype.kind == 'f':
+        # NaN != NaN
+        counts[numpy.isnan(left)] = 0
+    left_positions = numpy.repeat(numpy.arange(len(left)), counts)
+    # Position within each left row's run of matches, plus where that run starts
+    offsets = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    return left_positions, order[numpy.repeat(starts, counts) + offsets]
+
+
+def hash_join_positions(left_keys, left_length, right_keys, right_length):
+    left_keys = [to_list(keys) for keys in left_keys]
+    right_keys = [to_list(keys) for keys in right_keys]
+    table = {}
+    unhashable = []
+    for j in range(right_length):
+        key = tuple(keys[j] for keys in right_keys)
+        try:
+            table.setdefault(freeze(key), []).append(j)
+        except TypeError:
+            unhashable.append(j)
+
+    left_positions, right_positions = [], []
+    for i in range(left_length):
+        key = tuple(keys[i] for keys in left_keys)
+        try:
+            found = table.get(freeze(key), [])
+        except TypeError:
+            found = [j for j in range(right_length) if tuple(keys[j] for keys in right_keys) == key]
+        else:
+            if unhashable:
+                found = sorted(found + [j for j in unhashable if tuple(keys[j] for keys in right_keys) == key])
+        left_positions += [i] * len(found)
+        right_positions += found
+    return left_positions, right_positions
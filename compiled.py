@@ -0,0 +1,297 @@
+from .frozen import freeze
+from .lazy import concat, product
+from .simple import NoMatchException, everything, get_default
+from .symbol import Nullable, TransSymbol
+
+# Compiled templates: everything about a template which doesn't depend on the data (node types, symbol sets, literals,
+# Nullable/TransSymbol wrappers) is worked out once, up front. Each node class mirrors one branch of match_simple(),
+# and must return exactly the same results - except that the results are lazy (see lazy.py), so that they are only
+# enumerated as far as the caller actually needs.
+# When only some symbols are requested, subtrees without any of them are never expanded into bindings (they can't add
+# anything but {} to the cartesian product). They are only checked, with check(), and only if they contain something
+# which can actually fail to match.
+# Inside the engine, failure to match is signalled by returning a NoMatch rather than raising NoMatchException: with
+# lots of list candidates most of them fail, and raising and catching an exception for each one is slow. Only the
+# entry points (match_node() and CompiledTemplate) raise NoMatchException.
+
+
+class NoMatch(object):
+    # Returned in place of a result when the data doesn't match. Nodes which can fail make theirs up front, so failing
+    # doesn't allocate anything. args are what the NoMatchException gets, the same as match_simple would raise.
+    __slots__ = ['args']
+
+    def __init__(self, *args):
+        self.args = args
+
+    def exception(self):
+        return NoMatchException(*self.args)
+
+
+def match_node(node, data, symbols):
+    # node.match(), raising NoMatchException on failure
+    result = node.match(data, symbols)
+    if type(result) == NoMatch:
+        raise result.exception()
+    return result
+
+
+class Node(object):
+    # Base class for compiled template nodes. `template` is the raw template the node was compiled from, and `symbols`
+    # is the set of symbols appearing anywhere in the subtree.
+    template = None
+    symbols = frozenset()
+    constrained = False  # Whether check() can ever fail
+
+    def match(self, data, symbols):
+        # Returns a NoMatch right away if the data doesn't match; otherwise a (possibly lazy) re-iterable of bindings.
+        raise NotImplementedError
+
+    def check(self, data):
+        # Same as match(data, symbols) for symbols disjoint from self.symbols, without building any results: returns a
+        # NoMatch if the data doesn't match, None if it does.
+        return None
+
+    def unwrap(self):
+        # The node itself, minus any wrappers (see explain.py)
+        return self
+
+
+def relevant(node, symbols):
+    return symbols is everything or not node.symbols.isdisjoint(symbols)
+
+
+class SymbolNode(Node):
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.symbols = frozenset([symbol])
+
+    def match(self, data, symbols):
+        if self.symbol in symbols:
+            return [{self.symbol: data}]
+        return []
+
+
+class LiteralNode(Node):
+    constrained = True
+
+    def __init__(self, value):
+        self.value = value
+        self.failure = NoMatch()
+
+    def match(self, data, symbols):
+        if self.value != data:
+            return self.failure
+        return []
+
+    def check(self, data):
+        if self.value != data:
+            return self.failure
+        return None
+
+
+class NullableNode(Node):
+    def __init__(self, contents):
+        self.contents = contents
+        self.symbols = contents.symbols
+
+    def match(self, data, symbols):
+        result = self.contents.match(data, symbols)
+        if type(result) == NoMatch:
+            return []
+        return result
+
+
+class TransNode(Node):
+    def __init__(self, trans, inner):
+        self.trans = trans
+        self.reverse = trans._reverse
+        self.inner = inner
+        self.symbols = inner.symbols
+
+    def match(self, data, symbols):
+        if symbols is not everything and self.symbols.isdisjoint(symbols):
+            # template does not contain any of the symbols we care about
+            return []
+        try:
+            deduced = self.reverse(data)
+        except NoMatchException as e:
+            # Reverse functions are allowed to reject data this way
+            return NoMatch(*e.args)
+        inner = self.inner.match(deduced, symbols)
+        if type(inner) == NoMatch:
+            return inner
+        return product([[{self.trans: data}], inner])
+
+
+class DictNode(Node):
+    def __init__(self, items):
+        # items is a list of (key, node) pairs, in template order
+        self.items = items
+        self.symbols = frozenset().union(*[node.symbols for key, node in items])
+        self.constrained = any(node.constrained for key, node in items)
+
+    def match(self, data, symbols):
+        partials = []
+        for key, node in self.items:
+            if relevant(node, symbols):
+                result = node.match(get_default(data, key), symbols)
+                if type(result) == NoMatch:
+                    return result
+                partials.append(result)
+            elif node.constrained:
+                failure = node.check(get_default(data, key))
+                if failure is not None:
+                    return failure
+        if not partials and self.items:
+            # None of the requested symbols are in here (only possible at the top); same as a product of empty partials
+            return [{}]
+        return product(partials)
+
+    def check(self, data):
+        for key, node in self.items:
+            if node.constrained:
+                failure = node.check(get_default(data, key))
+                if failure is not None:
+                    return failure
+        return None
+
+
+class ListNode(Node):
+    # Data lists at least this long get indexed on the literal fields of the elements' templates (see selector())
+    INDEX_THRESHOLD = 8
+
+    def __init__(self, elements):
+        self.elements = elements
+        self.symbols = frozenset().union(*[node.symbols for node in elements])
+        self.selectors = [selector(node) for node in elements]
+        self.failures = [NoMatch(node.template) for node in elements]
+        # Even an element template without constraints fails if there is no data to match it to
+        self.constrained = len(elements) > 0
+
+    def match(self, data, symbols):
+        # Same xml hack as match_simple: data which isn't list-like is treated as a single-element list
+        if type(data) not in (list, tuple):
+            data = [data]
+
+        index = self.index(data)
+        partials = []
+        for element, element_selector, failure in zip(self.elements, self.selectors, self.failures):
+            candidates = data if index is None or element_selector is None else index.lookup(*element_selector)
+            if not relevant(element, symbols):
+                # Only needs one candidate which matches
+                if self.check_element(element, candidates) is not None:
+                    return failure
+                continue
+
+            matches = []
+            for candidate in candidates:
+                result = element.match(candidate, symbols)
+                if type(result) != NoMatch:
+                    matches.append(result)
+            if not matches:
+                return failure
+            partials.append(concat(matches))
+        if not partials and self.elements:
+            return [{}]
+        return product(partials)
+
+    def check(self, data):
+        if type(data) not in (list, tuple):
+            data = [data]
+        index = self.index(data)
+        for element, element_selector, failure in zip(self.elements, self.selectors, self.failures):
+            candidates = data if index is None or element_selector is None else index.lookup(*element_selector)
+            if self.check_element(element, candidates) is not None:
+                return failure
+        return None
+
+    def check_element(self, element, candidates):
+        # None if some candidate matches element
+        if not element.constrained and candidates:
+            return None
+        for candidate in candidates:
+            if element.check(candidate) is None:
+                return None
+        return element
+
+    def index(self, data):
+        if len(data) >= self.INDEX_THRESHOLD and any(self.selectors):
+            return LiteralIndex(data)
+        return None
+
+
+def selector(node):
+    # For a dict template with literal fields, e.g. {'type': 'contractor', 'name': S('name')}: the literal keys, and
+    # their (frozen) values. Only data with the same values for those keys can possibly match the template.
+    node = node.unwrap()
+    if type(node) != DictNode:
+        return None
+    keys, values = [], []
+    for key, value_node in node.items:
+        value_node = value_node.unwrap()
+        if type(value_node) != LiteralNode:
+            continue
+        try:
+            values.append(freeze(value_node.value))
+        except TypeError:
+            continue
+        keys.append(key)
+    if not keys:
+        return None
+    return tuple(keys), tuple(values)
+
+
+class LiteralIndex(object):
+    # The elements of a data list, by their values for a given tuple of keys. Built on first use for each tuple of keys,
+    # so list templates whose elements select on the same fields share one table.
+    # Lookups only narrow down the candidates: they still get matched against the full element template.
+    def __init__(self, data):
+        self.data = data
+        self.tables = {}  # keys -> (values -> positions, positions of elements which couldn't be indexed)
+
+    def lookup(self, keys, values):
+        return [self.data[p] for p in self.positions(keys, values)]
+
+    def positions(self, keys, values):
+        table = self.tables.get(keys)
+        if table is None:
+            table = self.tables[keys] = self._build(keys)
+        table, unindexed = table
+        positions = table.get(values, [])
+        if unindexed:
+            # Keep the data order, same as a plain scan
+            positions = sorted(positions + unindexed)
+        return positions
+
+    def _build(self, keys):
+        table = {}
+        unindexed = []
+        for p, candidate in enumerate(self.data):
+            try:
+                table.setdefault(tuple(freeze(get_default(candidate, key)) for key in keys), []).append(p)
+            except TypeError:
+                unindexed.append(p)
+        return table, unindexed
+
+
+def compile_template(template, wrap=None, path=''):
+    # Same dispatch order as match_simple.
+    # wrap(node, path), if given, is applied to every node, e.g. to instrument it; path is like 'contacts[0].name'.
+    if hasattr(template, '__substitute__'):
+        node = SymbolNode(template)
+    elif type(template) == Nullable:
+        node = NullableNode(compile_template(template.contents, wrap, path))
+    elif type(template) == TransSymbol:
+        node = TransNode(template, compile_template(template._symbol, wrap, path))
+    elif type(template) == dict:
+        node = DictNode([(key, compile_template(value, wrap, (path + '.' if path else '') + str(key)))
+                         for key, value in template.items()])
+    elif type(template) == list:
+        node = ListNode([compile_template(element, wrap, path + '[' + str(i) + ']')
+                         for i, element in enumerate(template)])
+    else:
+        node = LiteralNode(template)
+    node.template = template
+    if wrap is not None:
+        node = wrap(node, path)
+    return node
@@ -0,0 +1,199 @@
+from .analysis import has_symbols, template_nested, template_singles, template_symbols
+from .format import Bindings, format, format_lists, format_multi
+from .match import compile
+from .simple import NoMatchException, format_simple_single, match_simple, resolve_symbols
+from .symbol import Nullable, S, TransSymbol
+
+# Composite maps: an A -> B mapping built from an A -> C mapping (match_a, format_c) and a C -> B one (match_c,
+# format_b), as promised in the README.
+# Done naively, every record is matched against match_a, formatted into a C document, matched again against match_c
+# and formatted into B. Instead, compose() matches match_c against format_c once, symbolically, to work out where each
+# C symbol's value comes from in terms of A ("wiring"); then each record only needs the A match and the B format.
+# That only works when the C document's shape doesn't depend on the data, so anything else falls back to building C:
+#   - Symbols outside lists in match_c can come from any part of format_c which isn't itself a list of records.
+#   - Lists in match_c with one element template can line up with lists in format_c with one element template (which
+#     has no lists of its own), as long as each symbol in match_c's lines up with a plain symbol in format_c's. Then
+#     format_b can be formatted straight from match_a's matches, which gives the same records, in the same order,
+#     provided match_a has no joins and format_b never asks for symbols from two different lists of C at once.
+#   - Anywhere format_c doesn't depend on A (no symbols), match_c is matched against it right away.
+
+
+def compose(match_a, format_c, match_c, format_b):
+    return Composition(match_a, format_c, match_c, format_b)
+
+
+class Wiring(object):
+    def __init__(self):
+        self.singles = {}  # C symbol -> the part of format_c it matches, to be formatted with A's values
+        self.constants = {}  # C symbol -> value, where format_c has no symbols
+        self.renames = {}  # C symbol -> A symbol, for symbols in lists
+        self.group_of = {}  # C symbol in renames -> which list it's in (an index into groups)
+        self.groups = []  # For each list: the A symbols in format_c's element template
+
+
+class Composition(object):
+    def __init__(self, match_a, format_c, match_c, format_b):
+        self.match_a = compile(match_a)
+        self.match_c = compile(match_c)
+        self.format_c = format_c
+        self.format_b = format_b
+        self.singles = list(template_singles(format_c))
+        self.wiring = wire(self.match_a.template, format_c, self.match_c.template, format_b)
+        self.direct = self.wiring is not None
+        self.renamed = frozenset(self.wiring.renames.values()) if self.direct else frozenset()
+
+    def format(self, data):
+        # Same as format(format_b, match(match_c, format(format_c, match(match_a, data))))
+        if not self.direct:
+            return format(self.format_b, self.match_c.match(format(self.format_c, self.match_a.match(data))))
+        try:
+            return self.format_direct(data)
+        except NoMatchException as e:
+            err = NoMatchException(e)
+        # Same as format()
+        raise err
+
+    def format_direct(self, data):
+        wiring = self.wiring
+        bindings = Bindings(self.match_a.match(data))
+        # format_c's symbols outside lists take their values from the first match, as in format_multi
+        matched = bindings.select(self.singles)[0]
+        values = resolve_symbols(self.format_c, matched)
+        c_values = dict(wiring.constants)
+        for symbol, template in wiring.singles.items():
+            c_values[symbol] = format_simple_single(template, values)
+
+        bindings = bindings.bind(matched)
+        for symbols in wiring.groups:
+            # Each list in match_c needs at least one element to match
+            try:
+                found = bindings.exists(symbols)
+            except NoMatchException:
+                found = False
+            if not found:
+                raise NoMatchException('Empty list in composed mapping')
+
+        template = rename(format_simple_single(self.format_b, c_values), wiring.renames)
+        # A symbols which are bound already (because format_c uses them outside lists too) won't be substituted by
+        # format_multi, so that happens here
+        bound = {symbol: value for symbol, value in matched.items() if symbol in self.renamed}
+        if bound:
+            template = format_simple_single(template, bound)
+        if type(template) == list:
+            return format_lists(template, bindings)
+        return format_multi(template, bindings)[0]
+
+    def __repr__(self):
+        return 'compose(' + ', '.join(repr(t) for t in [self.match_a.template, self.format_c, self.match_c.template,
+                                                           self.format_b]) + ')'
+
+
+def wire(match_a, format_c, match_c, format_b):
+    # Wiring for the composition, or None if it can't be done symbolically
+    if type(format_c) == list or has_duplicates(template_symbols(match_c)):
+        return None
+    wiring = Wiring()
+    if not wire_node(match_c, format_c, wiring, None):
+        return None
+    if wiring.groups and has_duplicates(template_symbols(match_a)):
+        return None
+    wired = set(wiring.singles) | set(wiring.constants) | set(wiring.renames)
+    if any(symbol not in wired for symbol in template_symbols(format_b)):
+        # Symbols format_b leaves as they are, which could clash with match_a's
+        return None
+    if not one_group(format_b, wiring, frozenset()):
+        return None
+    return wiring
+
+
+def wire_node(match_c, format_c, wiring, group):
+    # Wires up the symbols match_c would bind if matched against format_c's output. group is the index of the list
+    # we're in, or None outside lists. False if this can't be worked out without the data.
+    if not has_symbols(format_c):
+        # The C data here doesn't depend on A, so it can be matched right away
+        try:
+            matches = match_simple(match_c, format_simple_single(format_c, {}))
+        except NoMatchException:
+            return False
+        if len(matches) > 1:
+            return False
+        if matches:
+            wiring.constants.update(matches[0])
+        # else a literal which matched (e.g. a selector like {'role': 'borrower'}), which binds nothing
+        return True
+
+    if type(match_c) == TransSymbol:
+        return False
+    elif hasattr(match_c, '__substitute__'):
+        if group is None:
+            if template_nested(format_c):
+                return False
+            wiring.singles[match_c] = format_c
+            return True
+        if type(format_c) != S:
+            return False
+        wiring.renames[match_c] = format_c
+        wiring.group_of[match_c] = group
+        return True
+    elif type(match_c) == Nullable:
+        # Whatever gets wired always matches, so the Nullable makes no difference
+        return group is None and wire_node(match_c.contents, format_c, wiring, group)
+    elif type(match_c) == dict:
+        if type(format_c) != dict:
+            return False
+        return all(wire_node(value, format_c.get(key), wiring, group) for key, value in match_c.items())
+    elif type(match_c) == list:
+        if group is not None or type(format_c) != list or len(match_c) != 1 or len(format_c) != 1:
+            return False
+        if template_nested(format_c[0]):
+            return False
+        wiring.groups.append(frozenset(template_symbols(format_c[0])))
+        return wire_node(match_c[0], format_c[0], wiring, len(wiring.groups) - 1)
+    return False
+
+
+def one_group(template, wiring, outer):
+    # Whether every set of symbols format() asks for at once (see format_multi) has symbols from at most one list of C
+    groups = outer | frozenset(wiring.group_of[symbol] for symbol in template_singles(template)
+                               if symbol in wiring.group_of)
+    if len(groups) > 1:
+        return False
+    return all(one_group(element, wiring, groups) for element in list_elements(template))
+
+
+def list_elements(template):
+    # Element templates of the outermost lists in template
+    if type(template) == dict:
+        for value in template.values():
+            for element in list_elements(value):
+                yield element
+    elif type(template) == list:
+        for element in template:
+            yield element
+    elif type(template) == Nullable:
+        for element in list_elements(template.contents):
+            yield element
+    elif type(template) == TransSymbol:
+        for element in list_elements(template._symbol):
+            yield element
+
+
+def rename(template, renames):
+    if not renames:
+        return template
+    if type(template) == dict:
+        return {key: rename(value, renames) for key, value in template.items()}
+    elif type(template) == list:
+        return [rename(element, renames) for element in template]
+    elif type(template) == Nullable:
+        return Nullable(rename(template.contents, renames))
+    elif type(template) == TransSymbol:
+        return TransSymbol(rename(template._symbol, renames), template._forward, template._reverse,
+                           vectorized=template._vectorized)
+    elif hasattr(template, '__substitute__'):
+        return renames.get(template, template)
+    return template
+
+
+def has_duplicates(symbols):
+    return len(set(symbols)) != len(symbols)
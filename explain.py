@@ -0,0 +1,137 @@
+from .compiled import NoMatch, Node
+from .format import format
+from .lazy import Product, count
+from .match import CompiledTemplate, Match
+from .simple import NoMatchException
+
+import time
+
+# Profiling for match/format, for when a mapping is slow and it isn't clear why.
+# explain(template, data) compiles the template with every node wrapped in a ProfiledNode, which counts what that part
+# of the template costs, then runs the match (and optionally a format) with it. Nothing here is involved in normal
+# matching, so that costs exactly the same as ever.
+
+
+class PathStats(object):
+    # Counts for one node of the template
+    def __init__(self, path, kind):
+        self.path = path  # e.g. 'contacts[0].name'; '' for the top of the template
+        self.kind = kind  # e.g. 'DictNode'; a Nullable and its contents share a path, but not a kind
+        self.visits = 0  # match()/check() calls. For list elements, that's the number of candidates tried.
+        self.failures = 0  # Failed matches
+        self.time = 0.0  # Including children
+        self.products = []  # Products (cartesian/join steps) built here
+
+    # Counting rows takes a walk over the factors, so that's done when they're asked for rather than while matching
+    @property
+    def joins(self):
+        return len(self.products)
+
+    @property
+    def rows_in(self):
+        # Total rows in the partials going into the products...
+        return sum(count(partial) for product in self.products for partial in product.partials)
+
+    @property
+    def rows_out(self):
+        # ...and in the products themselves
+        return sum(count(product) for product in self.products)
+
+    def as_dict(self):
+        return dict(path=self.path, kind=self.kind, visits=self.visits, failures=self.failures, time=self.time,
+                    joins=self.joins, rows_in=self.rows_in, rows_out=self.rows_out)
+
+
+class ProfiledNode(Node):
+    def __init__(self, node, stats):
+        self.node = node
+        self.stats = stats
+        self.template = node.template
+        self.symbols = node.symbols
+        self.constrained = node.constrained
+
+    def match(self, data, symbols):
+        stats = self.stats
+        stats.visits += 1
+        start = time.perf_counter()
+        result = self.node.match(data, symbols)
+        stats.time += time.perf_counter() - start
+        if type(result) == NoMatch:
+            stats.failures += 1
+        elif type(result) == Product:
+            stats.products.append(result)
+        return result
+
+    def check(self, data):
+        stats = self.stats
+        stats.visits += 1
+        start = time.perf_counter()
+        failure = self.node.check(data)
+        if failure is not None:
+            stats.failures += 1
+        stats.time += time.perf_counter() - start
+        return failure
+
+    def unwrap(self):
+        return self.node.unwrap()
+
+
+class Report(object):
+    def __init__(self):
+        self.paths = {}  # (path, kind) -> PathStats
+        self.outer = {}  # path -> PathStats of the outermost node there (nodes are wrapped children first)
+        self.rows = None  # Number of matches, if the data matched
+        self.error = None  # The NoMatchException, if it didn't
+        self.rematches = 0  # Matches against the whole template run by format (one per set of symbols it needed)
+        self.time = 0.0
+
+    def wrap(self, node, path):
+        key = (path, type(node).__name__)
+        stats = self.paths.get(key)
+        if stats is None:
+            stats = self.paths[key] = PathStats(*key)
+        self.outer[path] = stats
+        return ProfiledNode(node, stats)
+
+    def totals(self):
+        stats = list(self.paths.values())
+        return dict(visits=sum(s.visits for s in stats), failures=sum(s.failures for s in stats),
+                    candidates=sum(s.visits for path, s in self.outer.items() if path.endswith(']')),
+                    joins=sum(s.joins for s in stats), rows=self.rows, rematches=self.rematches, time=self.time)
+
+    def most_expensive(self, n=10):
+        # Paths which took longest. Times include children, so parents come before their expensive children.
+        return sorted(self.paths.values(), key=lambda s: (-s.time, s.path))[:n]
+
+    def __str__(self):
+        totals = self.totals()
+        lines = ['%(visits)d nodes visited, %(candidates)d list candidates tried, %(failures)d failed matches, '
+                 '%(rows)s rows, %(rematches)d re-matches for format, %(time).3fs' % totals]
+        if self.error is not None:
+            lines.append('no match: ' + str(self.error))
+        lines.append('%-40s %-12s %8s %8s %10s %10s %10s' % ('path', 'node', 'visits', 'failed', 'rows in', 'rows out',
+                                                                'ms'))
+        for s in self.most_expensive():
+            lines.append('%-40s %-12s %8d %8d %10d %10d %10.2f' % (s.path or '(top)', s.kind, s.visits, s.failures,
+                                                                      s.rows_in, s.rows_out, s.time * 1000))
+        return '\n'.join(lines)
+
+
+def explain(template, data, format_template=None):
+    # Match data against template (and then format format_template with the result, if given), and report where the
+    # time went. Doesn't raise if the data doesn't match; the exception goes in report.error instead.
+    report = Report()
+    compiled = CompiledTemplate(template.template if type(template) == CompiledTemplate else template, report.wrap)
+    m = Match(compiled, data)
+    top = compiled.root.stats
+    start = time.perf_counter()
+    try:
+        report.rows = m.count()
+        if format_template is not None:
+            visits = top.visits
+            format(format_template, m)
+            report.rematches = top.visits - visits
+    except NoMatchException as e:
+        report.error = e
+    report.time = time.perf_counter() - start
+    return report
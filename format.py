@@ -1,41 +1,98 @@
-from .match import match, Match
-from .simple import match_simple, format_simple_single, format_simple, get_symbols, NoMatchException
+from .analysis import analyze, has_symbols, template_singles
+from .join import JoinIndex
+from .match import Match
+from .simple import format_simple_single, format_simple, resolve_symbols, unique, NoMatchException
 from .symbol import Nullable, TransSymbol
 
 # See README for usage info
 
 
 def get_singles(template):
-    if type(template) == TransSymbol:
-        return get_singles(template._symbol)
-    if hasattr(template, '__substitute__'):
-        return [template]
-    if type(template) == list:
-        return []
-    if type(template) == dict:
-        return sum([get_singles(v) for v in template.values()], [])
-    if type(template) == Nullable:
-        return get_singles(template.contents)
-    return []
+    # Symbols in the template which are NOT inside any list (see analysis.py)
+    return list(template_singles(template))
+
+
+class Bindings(object):
+    # The matches in match_obj which are consistent with the values already bound in `bound`. This is what format_multi
+    # hands down to nested list templates, in place of re-matching the data against the match template with the bound
+    # values substituted in: the matches for each set of symbols are computed once per format() call, and indexed on
+    # the bound symbols, so each group just looks up its own matches.
+    def __init__(self, match_obj, bound=None, indexes=None):
+        self.match_obj = match_obj
+        self.bound = bound or {}
+        self.indexes = {} if indexes is None else indexes  # Shared by all the Bindings in one format() call
+
+    def select(self, symbols):
+        # Same as match_simple(<match template with the bound values substituted>, data, symbols=symbols)
+        if not symbols:
+            # Same corner case as match_simple
+            return [{}]
+        matches = self.lookup(symbols)
+        # Keep the requested symbols, plus any TransSymbols involving them (format_simple_single needs those).
+        return unique({k: v for k, v in m.items() if k not in self.bound and (k in symbols or type(k) == TransSymbol)}
+                      for m in matches)
+
+    def exists(self, symbols):
+        # Same as bool(self.select(symbols))
+        if not symbols:
+            return True
+        return bool(self.lookup(symbols))
+
+    def lookup(self, symbols):
+        # The matches for symbols plus the bound ones, which agree with the bound values
+        requested = frozenset(symbols).union(self.bound)
+        index = self.indexes.get(requested)
+        if index is None:
+            index = JoinIndex()
+            for m in self.match_obj.iter_matches(requested):
+                index.add(m)
+            self.indexes[requested] = index
+        return index.lookup(self.bound) if self.bound else index.candidates
+
+    def bind(self, matched):
+        bound = dict(self.bound)
+        bound.update(matched)
+        return Bindings(self.match_obj, bound, self.indexes)
 
 
 def format_multi(template, match_obj):
     # Assumption: outermost level of template is NOT a list.
-    singles = get_singles(template)  # Get symbols in the template which are NOT inside any list
-    matches = match_simple(match_obj.template, match_obj.data, symbols=singles)
-    # print(singles, matches)
+    bindings = match_obj if type(match_obj) == Bindings else Bindings(match_obj, None, match_obj.indexes)
+    # Symbols in the template which are NOT inside any list, those which are, vectorized TransSymbols and
+    # SymbolicAddresses (see analysis.py)
+    info = analyze(template)
 
     results = []
-    for matched in matches:
-        new_match_template = format_simple_single(match_obj.template, matched)
-        new_match_obj = match(new_match_template, match_obj.data)
-
-        new_template = format_simple_single(template, matched)
-        # print("pre-list-format result:", new_template, new_match_template)
-        results.append(format_lists(new_template, new_match_obj))
+    selected = bindings.select(info.singles)
+    vectorized = vectorize(info.vectorized, selected) if info.vectorized else None
+    for i, matched in enumerate(selected):
+        values = resolve_symbols(template, matched, info.resolvable) if info.resolvable else matched
+        if vectorized is not None and vectorized[i]:
+            # format_simple_single substitutes TransSymbols found in values
+            values = dict(values)
+            values.update(vectorized[i])
+        new_template = format_simple_single(template, values)
+        if not info.nested:
+            # No lists with symbols in them, so nothing left for format_lists to do
+            results.append(new_template)
+            continue
+        results.append(format_lists(new_template, bindings.bind(matched)))
     return results
 
 
+def vectorize(transforms, rows):
+    # The values of vectorized TransSymbols (see TransSymbol) for each row, from one call for each of them
+    from .columns import column
+    found = [{} for row in rows]
+    for trans in transforms:
+        positions = [i for i, row in enumerate(rows) if trans._symbol in row]
+        if positions:
+            results = trans._vectorize(column([rows[i][trans._symbol] for i in positions]))
+            for i, result in zip(positions, results):
+                found[i][trans] = result
+    return found
+
+
 def format_lists(template, match_obj):
     # Assumption: there should be no symbols outside of lists in template
     # As long as that assumption holds, it's time to call format_lists
@@ -52,14 +109,14 @@ def format_lists(template, match_obj):
         return result
     elif type(template) == Nullable:
         result = format_lists(template.contents, match_obj)
-        if get_symbols(result):
+        if has_symbols(result):
             return Nullable(result)
         return result
     elif type(template) == TransSymbol:
         result = format_lists(template._symbol, match_obj)
-        if not get_symbols(result):
+        if not has_symbols(result):
             return template._forward(result)
-        return TransSymbol(result, template._forward, template._reverse)
+        return TransSymbol(result, template._forward, template._reverse, vectorized=template._vectorized)
     return template
 
 
@@ -0,0 +1,48 @@
+# Hashable stand-ins for json-style values, so that matches can be deduplicated and joined through sets and dicts
+# rather than by comparing every pair.
+
+
+def freeze(value):
+    # Canonical hashable version of value: freeze(a) == freeze(b) exactly when a == b.
+    # Raises TypeError for values which can't be made hashable (i.e. unhashable objects other than dicts/lists/sets).
+    if isinstance(value, dict):
+        return (dict, frozenset((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        # Tagged, since e.g. [1] != (1,)
+        return (list if isinstance(value, list) else tuple, tuple(freeze(v) for v in value))
+    if isinstance(value, set):
+        # {1} == frozenset([1]), so no tag
+        return frozenset(value)
+    hash(value)
+    return value
+
+
+def freeze_match(m, memo):
+    # freeze() for a single match. Matches often share the same (possibly large) data objects as values, so the frozen
+    # versions of containers are memoized by id. memo also holds a reference to each value, so ids can't be reused.
+    items = []
+    for k, v in m.items():
+        if isinstance(v, (dict, list, tuple, set)):
+            cached = memo.get(id(v))
+            if cached is None:
+                cached = memo[id(v)] = (v, freeze(v))
+            v = cached[1]
+        else:
+            hash(v)
+        items.append((k, v))
+    return frozenset(items)
+
+
+def freeze_row(row, memo):
+    # freeze_match() for tuple rows (see join.py)
+    values = []
+    for v in row:
+        if isinstance(v, (dict, list, tuple, set)):
+            cached = memo.get(id(v))
+            if cached is None:
+                cached = memo[id(v)] = (v, freeze(v))
+            v = cached[1]
+        else:
+            hash(v)
+        values.append(v)
+    return tuple(values)
@@ -0,0 +1,207 @@
+from .frozen import freeze
+
+# Hash join for cartesian products of partial matches.
+# Two bindings can be combined if they agree on all of the symbols they have in common; if they have no symbols in
+# common, that's just the cartesian product. Rather than comparing every pair, we index the candidates on the symbols
+# they share with each remainder, so each remainder only ever looks at compatible candidates.
+
+
+def iter_join(remainders, candidates):
+    # Yields the combination of each remainder with each compatible candidate, in the same order as the nested loop
+    #   for remainder in remainders: for candidate in candidates: ...
+    # `candidates` is only iterated once. The first remainder does a plain scan (so the first results come out without
+    # waiting for the index), and everything after that goes through the index built during the scan.
+    index = None
+    for remainder in remainders:
+        if index is None:
+            index = JoinIndex()
+            for candidate in candidates:
+                index.add(candidate)
+                if compatible(remainder, candidate):
+                    yield combine(remainder, candidate)
+            continue
+
+        for candidate in index.lookup(remainder):
+            yield combine(remainder, candidate)
+
+
+def compatible(a, b):
+    for k in a:
+        if k in b and a[k] != b[k]:
+            return False
+    return True
+
+
+def combine(remainder, candidate):
+    full = {k:v for k,v in remainder.items()}
+    full.update(candidate)
+    return full
+
+
+class JoinIndex(object):
+    # Candidates are grouped by their set of symbols ("schema"); usually there's only one. For each combination of
+    # candidate schema and remainder schema, we build (on first use) a hash table keyed on the values of their common
+    # symbols.
+    def __init__(self):
+        self.candidates = []
+        self.schemas = {}  # schema -> positions of candidates with that schema
+        self.plans = {}  # remainder schema -> list of (positions, common symbols, table)
+
+    def add(self, candidate):
+        self.schemas.setdefault(self.candidate_schema(candidate), []).append(len(self.candidates))
+        self.candidates.append(candidate)
+
+    def lookup(self, remainder):
+        schema = self.remainder_schema(remainder)
+        plan = self.plans.get(schema)
+        if plan is None:
+            plan = self.plans[schema] = [self._plan(positions, tuple(schema.intersection(candidate_schema)))
+                                         for candidate_schema, positions in self.schemas.items()]
+
+        if len(plan) == 1:
+            return [self.candidates[p] for p in self._positions(plan[0], remainder)]
+        # Several candidate schemas: put the positions back in the original candidate order
+        positions = sorted(p for group in plan for p in self._positions(group, remainder))
+        return [self.candidates[p] for p in positions]
+
+    def _plan(self, positions, common):
+        if not common:
+            return positions, common, None
+        table = {}
+        unhashable = []
+        for p in positions:
+            candidate = self.candidates[p]
+            try:
+                table.setdefault(self.candidate_key(candidate, common), []).append(p)
+            except TypeError:
+                unhashable.append(p)
+        return positions, common, (table, unhashable)
+
+    def _positions(self, group, remainder):
+        positions, common, table = group
+        if table is None:
+            # Nothing in common: cartesian product
+            return positions
+        table, unhashable = table
+        try:
+            found = table.get(self.remainder_key(remainder, common), [])
+        except TypeError:
+            # Can't hash the remainder's values, so fall back to comparing against every candidate
+            return [p for p in positions if self.compatible(remainder, self.candidates[p])]
+        if unhashable:
+            extra = [p for p in unhashable if self.compatible(remainder, self.candidates[p])]
+            return sorted(found + extra)
+        return found
+
+    # How rows are read. For dict rows: symbols present, and the frozen values of the given symbols.
+    def candidate_schema(self, candidate):
+        return frozenset(candidate)
+
+    def remainder_schema(self, remainder):
+        return frozenset(remainder)
+
+    def candidate_key(self, candidate, common):
+        return tuple(freeze(candidate[k]) for k in common)
+
+    def remainder_key(self, remainder, common):
+        return tuple(freeze(remainder[k]) for k in common)
+
+    def compatible(self, remainder, candidate):
+        return compatible(remainder, candidate)
+
+
+# Tuple rows, for the compiled engine (see lazy.py): each row is a tuple of values against a schema (a tuple of
+# symbols) shared by all the rows of a result, with MISSING for symbols a row doesn't bind. That's a lot smaller than a
+# dict per row, and combining two rows is just concatenating tuples.
+
+class Missing(object):
+    def __repr__(self):
+        return 'MISSING'
+
+MISSING = Missing()
+
+
+def join_schema(outer, inner):
+    # Schema of the join of rows with schema `outer` and rows with schema `inner`
+    seen = set(outer)
+    return outer + tuple(symbol for symbol in inner if symbol not in seen)
+
+
+def join_rows(outer_schema, outer, inner_schema, inner):
+    # Tuple-row version of iter_join: yields the combination of each outer row with each compatible inner row, in the
+    # order of the nested loop (outer rows being the outer loop), against join_schema(outer_schema, inner_schema).
+    # `inner` is only iterated once.
+    outer_positions = {symbol: p for p, symbol in enumerate(outer_schema)}
+    common = [(outer_positions[symbol], p) for p, symbol in enumerate(inner_schema) if symbol in outer_positions]
+    extra = [p for p, symbol in enumerate(inner_schema) if symbol not in outer_positions]
+    if not common:
+        return _product_rows(outer, inner, extra, len(extra) == len(inner_schema))
+    return _join_rows(outer, inner, common, extra)
+
+
+def _product_rows(outer, inner, extra, whole):
+    # Nothing in common: every outer row goes with every inner row
+    extensions = None
+    for o in outer:
+        if extensions is None:
+            extensions = []
+            for c in inner:
+                e = c if whole else tuple(c[p] for p in extra)
+                extensions.append(e)
+                yield o + e
+            continue
+        for e in extensions:
+            yield o + e
+
+
+def _join_rows(outer, inner, common, extra):
+    # Same as iter_join: the first outer row scans the inner rows while they're being indexed
+    index = None
+    for o in outer:
+        if index is None:
+            index = RowIndex(common)
+            for c in inner:
+                index.add(c)
+                if index.compatible(o, c):
+                    yield combine_rows(o, c, common, extra)
+            continue
+
+        for c in index.lookup(o):
+            yield combine_rows(o, c, common, extra)
+
+
+def combine_rows(o, c, common, extra):
+    # Same as combine(): the inner row's values win
+    row = list(o)
+    for po, pc in common:
+        if c[pc] is not MISSING:
+            row[po] = c[pc]
+    return tuple(row) + tuple(c[p] for p in extra)
+
+
+class RowIndex(JoinIndex):
+    # JoinIndex over tuple rows. `common` is a list of (outer position, inner position) pairs for the shared symbols;
+    # the index's "symbols" are positions in that list.
+    def __init__(self, common):
+        JoinIndex.__init__(self)
+        self.outer_positions = [po for po, pc in common]
+        self.inner_positions = [pc for po, pc in common]
+
+    def candidate_schema(self, candidate):
+        return frozenset(j for j, p in enumerate(self.inner_positions) if candidate[p] is not MISSING)
+
+    def remainder_schema(self, remainder):
+        return frozenset(j for j, p in enumerate(self.outer_positions) if remainder[p] is not MISSING)
+
+    def candidate_key(self, candidate, common):
+        return tuple(freeze(candidate[self.inner_positions[j]]) for j in common)
+
+    def remainder_key(self, remainder, common):
+        return tuple(freeze(remainder[self.outer_positions[j]]) for j in common)
+
+    def compatible(self, remainder, candidate):
+        for po, pc in zip(self.outer_positions, self.inner_positions):
+            a, b = remainder[po], candidate[pc]
+            if a is not MISSING and b is not MISSING and a != b:
+                return False
+        return True
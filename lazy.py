@@ -0,0 +1,345 @@
+from .frozen import freeze_row
+from .join import MISSING, join_rows, join_schema
+from .simple import iter_unique
+
+from itertools import chain
+from operator import itemgetter
+
+# Lazy, factorized counterparts of cartesian() and unique() for the compiled engine.
+# Matching happens in two phases: compiled nodes check the data against the template eagerly (so NoMatchException is
+# raised at the same point as in match_simple), but the possible bindings are only enumerated when someone iterates
+# over them. Until then, a match result is kept in factorized form: a Product of partials (one per dict key/list
+# element, as in cartesian()), a Union of the results for each list candidate, or a plain list of bindings.
+# Counting, reading off a symbol's values and projecting all work from the factors, so they don't need the full
+# cartesian product.
+# While enumerating, rows are kept as tuples against a schema shared by the whole result (see join.py), and only turned
+# into dicts on the way out of __iter__.
+
+
+class Product(object):
+    # unique(cartesian(partials)). Re-iterable; rows are computed on the fly and not stored.
+    def __init__(self, partials):
+        self.partials = partials
+        self._symbols = None
+        self._components = None
+        self._nonempty = None
+        # Worked out up front from the partials' own schemas, which are already known (so deep nesting doesn't recurse)
+        self.schemas = [schema(partial) for partial in partials]
+        self._schema = merge_schemas(reversed(self.schemas))
+
+    def __iter__(self):
+        return iter_dicts(self._schema, self.iter_rows())
+
+    def schema(self):
+        return self._schema
+
+    def iter_rows(self):
+        # The joins are only set up once iteration starts; otherwise nested products would all set theirs up,
+        # recursively, before the first row.
+        return iter_unique(Deferred(self.join_rows), freeze_row)
+
+    def join_rows(self):
+        # Partials without any bindings are ignored; see cartesian() for the details.
+        pairs = [(partial, partial_schema) for partial, partial_schema in zip(self.partials, self.schemas) if partial]
+        if len(pairs) == 0:
+            return iter([()])
+        rows_schema, rows = product_rows(pairs)
+        if rows_schema != self._schema:
+            # Some partial with symbols turned out to be empty
+            rows = remap(rows, rows_schema, self._schema)
+        return rows
+
+    def __bool__(self):
+        if self._nonempty is None:
+            if all(len(component) == 1 for component in self.components()):
+                # Nothing to join, so there's a row as long as each partial has one (and empty partials were dropped)
+                self._nonempty = True
+            else:
+                self._nonempty = False
+                for row in self.iter_rows():
+                    self._nonempty = True
+                    break
+        return self._nonempty
+
+    def symbols(self):
+        if self._symbols is None:
+            self._symbols = frozenset().union(*[symbols(partial) for partial in self.partials])
+        return self._symbols
+
+    def components(self):
+        # Groups of (non-empty) partials which share symbols, i.e. which have to be joined. Different groups are
+        # independent of each other, so the rows of the product are exactly the combinations of the rows of each group.
+        # Each group is a list of (partial, symbols) pairs, in the original partial order.
+        if self._components is None:
+            # Union-find over the partials, joining each one to the first partial seen with each of its symbols
+            parent = {}
+            first = {}  # symbol -> first partial with it
+            pairs = []
+            for i, partial in enumerate(self.partials):
+                if not partial:
+                    continue
+                partial_symbols = symbols(partial)
+                pairs.append((i, partial, partial_symbols))
+                parent[i] = i
+                for symbol in partial_symbols:
+                    if symbol in first:
+                        parent[find(parent, i)] = find(parent, first[symbol])
+                    else:
+                        first[symbol] = i
+            groups = {}
+            last = {}
+            for i, partial, partial_symbols in pairs:
+                root = find(parent, i)
+                groups.setdefault(root, []).append((partial, partial_symbols))
+                last[root] = i
+            # Groups are ordered by their last partial
+            self._components = [groups[root] for root in sorted(groups, key=lambda root: last[root])]
+        return self._components
+
+    def count(self):
+        total = 1
+        for component in self.components():
+            if len(component) == 1:
+                n = count(component[0][0])
+            else:
+                n = sum(1 for row in iter_unique(component_rows(component)[1], freeze_row))
+            if n == 0:
+                return 0
+            total *= n
+        return total
+
+    def values(self, symbol):
+        if not self:
+            return []
+        for component in self.components():
+            if not any(symbol in s for p, s in component):
+                continue
+            if len(component) == 1:
+                return values(component[0][0], symbol)
+            rows_schema, rows = component_rows(component)
+            position = rows_schema.index(symbol)
+            return distinct(row[position] for row in rows if row[position] is not MISSING)
+        return []
+
+    def project(self, projected):
+        # Distinct rows restricted to the given symbols. Components without any of those symbols only matter in so far
+        # as they might be empty (in which case so is the whole product).
+        if not self:
+            return []
+        parts = []
+        for component in self.components():
+            if all(s.isdisjoint(projected) for p, s in component):
+                continue
+            if len(component) == 1:
+                parts.append(project(component[0][0], projected))
+            else:
+                rows_schema, rows = component_rows(component)
+                parts.append(list(iter_unique(iter_dicts(rows_schema, rows, projected))))
+        if len(parts) == 0:
+            return [{}]
+        return Product(parts)
+
+
+class Deferred(object):
+    # An iterable whose iterator is only made when iteration starts
+    def __init__(self, make):
+        self.make = make
+
+    def __iter__(self):
+        return self.make()
+
+
+class Union(object):
+    # Concatenation of match results, e.g. the results for each candidate element of a list. Not deduplicated; the
+    # enclosing Product takes care of that.
+    def __init__(self, parts):
+        self.parts = parts
+        self._symbols = None
+        self._schema = merge_schemas(schema(part) for part in parts)
+
+    def __iter__(self):
+        return chain.from_iterable(self.parts)
+
+    def schema(self):
+        return self._schema
+
+    def iter_rows(self):
+        for part in self.parts:
+            if type(part) == list:
+                rows = iter_rows(part, self._schema)
+            else:
+                rows = part.iter_rows()
+                if part.schema() != self._schema:
+                    rows = remap(rows, part.schema(), self._schema)
+            for row in rows:
+                yield row
+
+    def __bool__(self):
+        return any(self.parts)
+
+    def symbols(self):
+        if self._symbols is None:
+            self._symbols = frozenset().union(*[symbols(part) for part in self.parts])
+        return self._symbols
+
+    def count(self):
+        return sum(1 for row in iter_unique(self.iter_rows(), freeze_row))
+
+    def values(self, symbol):
+        return distinct(v for part in self.parts for v in values(part, symbol))
+
+    def project(self, projected):
+        return Union([project(part, projected) for part in self.parts])
+
+
+def concat(results):
+    # Lazy equivalent of summing a list of match results
+    if all(type(result) == list for result in results):
+        return list(chain.from_iterable(results))
+    return Union(results)
+
+
+def product(partials):
+    # Lazy equivalent of unique(cartesian(partials))
+    if len(partials) == 0:
+        return []
+    if all(type(partial) == list and len(partial) <= 1 for partial in partials):
+        # At most one row each (e.g. a dict of plain symbols), so there's at most one row in all: just combine them,
+        # the same way the join would.
+        row = {}
+        for partial in reversed(partials):
+            if partial:
+                for k, v in partial[0].items():
+                    if k in row and row[k] != v:
+                        return []
+                    row[k] = v
+        return [row]
+    return Product(partials)
+
+
+def product_rows(pairs):
+    # (schema, rows) for the rows of the cartesian product/join of the partials, not deduplicated. pairs is a list of
+    # (partial, schema(partial)) pairs; all the partials must be non-empty. Same order as cartesian(): the last partial
+    # is the outermost loop.
+    # Split in halves rather than peeling off one partial at a time, so that wide templates (thousands of keys) don't
+    # nest thousands of generators deep. The order comes out the same: rows of the later half are the outer loop.
+    if len(pairs) == 1:
+        partial, partial_schema = pairs[0]
+        return partial_schema, iter_rows(partial, partial_schema)
+    mid = len(pairs) // 2
+    outer_schema, outer = product_rows(pairs[mid:])
+    inner_schema, inner = product_rows(pairs[:mid])
+    return join_schema(outer_schema, inner_schema), join_rows(outer_schema, outer, inner_schema, inner)
+
+
+def component_rows(component):
+    # product_rows() for a component (see Product.components)
+    return product_rows([(partial, schema(partial)) for partial, partial_symbols in component])
+
+
+def merge_schemas(schemas):
+    # All the symbols in the schemas, in the order they first appear
+    symbols = {}
+    for s in schemas:
+        for symbol in s:
+            symbols.setdefault(symbol, None)
+    return tuple(symbols)
+
+
+def iter_rows(result, result_schema):
+    # Rows of result as tuples, against result_schema (which must be schema(result), or for lists, may have more symbols)
+    if type(result) == list:
+        return list_rows(result, result_schema)
+    return result.iter_rows()
+
+
+def list_rows(result, result_schema):
+    n = len(result_schema)
+    if n == 0:
+        for m in result:
+            yield ()
+    elif n == 1:
+        symbol = result_schema[0]
+        for m in result:
+            yield (m.get(symbol, MISSING),)
+    else:
+        get_all = itemgetter(*result_schema)
+        for m in result:
+            if len(m) == n:
+                # Has every symbol in the schema
+                yield get_all(m)
+            else:
+                yield tuple(m.get(symbol, MISSING) for symbol in result_schema)
+
+
+def iter_dicts(row_schema, rows, projected=None):
+    # Rows as dicts, optionally restricted to the symbols in projected
+    if projected is None:
+        return ({symbol: v for symbol, v in zip(row_schema, row) if v is not MISSING} for row in rows)
+    kept = [(p, symbol) for p, symbol in enumerate(row_schema) if symbol in projected]
+    return ({symbol: row[p] for p, symbol in kept if row[p] is not MISSING} for row in rows)
+
+
+def remap(rows, old_schema, new_schema):
+    # Rows moved to another schema with (at least) the same symbols
+    positions = {symbol: p for p, symbol in enumerate(old_schema)}
+    positions = [positions.get(symbol) for symbol in new_schema]
+    for row in rows:
+        yield tuple(MISSING if p is None else row[p] for p in positions)
+
+
+def find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+# The functions below work on any match result, including plain lists of bindings.
+
+def schema(result):
+    # Symbols of the rows, in order. For lists, in the order they first appear.
+    if type(result) == list:
+        symbols = {}
+        for m in result:
+            for symbol in m:
+                symbols.setdefault(symbol, None)
+        return tuple(symbols)
+    return result.schema()
+
+
+def symbols(result):
+    # All the symbols bound in any row of the result
+    if type(result) == list:
+        return frozenset(k for m in result for k in m)
+    return result.symbols()
+
+
+def count(result):
+    # Number of distinct rows
+    if type(result) == list:
+        return sum(1 for m in iter_unique(result))
+    return result.count()
+
+
+def values(result, symbol):
+    # Distinct values of a symbol, in the order they first appear
+    if type(result) == list:
+        return distinct(m[symbol] for m in result if symbol in m)
+    return result.values(symbol)
+
+
+def project(result, projected):
+    # Distinct rows, restricted to the given symbols
+    if type(result) == list:
+        return list(iter_unique(restrict(m, projected) for m in result))
+    return result.project(projected)
+
+
+def restrict(m, projected):
+    return {k: v for k, v in m.items() if k in projected}
+
+
+def distinct(values):
+    # Wrap each value as a one-symbol match, to reuse iter_unique's handling of unhashable values
+    return [m[0] for m in iter_unique({0: v} for v in values)]
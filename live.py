@@ -0,0 +1,226 @@
+from .compiled import DictNode, ListNode, NoMatch, NullableNode, relevant
+from .frozen import freeze
+from .lazy import concat, product
+from .merge import set_general
+from .simple import get_default
+
+from bisect import bisect_left
+import re
+
+# Live matches, for data which changes a little at a time: Match.patch(path, value) writes value into the data, then
+# brings the match up to date by re-matching only the parts of the template which the path runs through.
+# A Live mirrors one compiled node (see compiled.py) applied to one piece of data, and holds on to the results for
+# that node's children, so that a patch only recomputes the nodes on its path: siblings keep their results as they were.
+# Like the compiled nodes, Lives work for a given set of symbols: result is node.match(data, symbols) if the node has
+# any of them, and node.check(data) (None, or a NoMatch) if it doesn't.
+
+
+class Live(object):
+    def __init__(self, node, data, symbols):
+        self.node = node
+        self.data = data
+        self.symbols = symbols
+        self.relevant = relevant(node, symbols)
+        self.result = None
+
+    def patch(self, path):
+        # The data at path (relative to self.data; never empty) has been changed. Updates self.result, and returns
+        # whether that could make any difference to the parent.
+        raise NotImplementedError
+
+    def update(self, result):
+        old, self.result = self.result, result
+        return changed(old, self)
+
+
+def changed(old, new):
+    # Whether replacing a Live whose result was old with new could change the parent's result. Results of matches
+    # are rebuilt, so always count as changed; checks only change if they start or stop failing.
+    return new.relevant or old is not new.result
+
+
+class LiveLeaf(Live):
+    # Symbols, literals, TransSymbols etc.: nothing worth keeping, so they're just matched again
+    def __init__(self, node, data, symbols):
+        Live.__init__(self, node, data, symbols)
+        self.result = self.compute()
+
+    def compute(self):
+        if self.relevant:
+            return self.node.match(self.data, self.symbols)
+        return self.node.check(self.data)
+
+    def patch(self, path):
+        return self.update(self.compute())
+
+
+class LiveNullable(Live):
+    def __init__(self, node, data, symbols):
+        Live.__init__(self, node, data, symbols)
+        self.contents = live(node.contents, data, symbols)
+        self.result = self.compute()
+
+    def compute(self):
+        if not self.relevant:
+            return None
+        result = self.contents.result
+        if type(result) == NoMatch:
+            return []
+        return result
+
+    def patch(self, path):
+        if not self.contents.patch(path):
+            return False
+        return self.update(self.compute())
+
+
+class LiveDict(Live):
+    def __init__(self, node, data, symbols):
+        Live.__init__(self, node, data, symbols)
+        self.children = {}  # key -> Live, for the items which can make a difference (see DictNode.match)
+        for key, child in node.items:
+            if relevant(child, symbols) or child.constrained:
+                self.children[key] = live(child, get_default(data, key), symbols)
+        self.result = self.compute()
+
+    def compute(self):
+        # Same as DictNode.match()/check(), from the children's results
+        partials = []
+        for child in self.children.values():
+            result = child.result
+            if type(result) == NoMatch:
+                return result
+            if child.relevant:
+                partials.append(result)
+        if not self.relevant:
+            return None
+        if not partials and self.node.items:
+            return [{}]
+        return product(partials)
+
+    def patch(self, path):
+        key = path[0]
+        child = self.children.get(key)
+        if child is None:
+            # Not part of the template
+            return False
+        if len(path) == 1:
+            new = self.children[key] = live(child.node, get_default(self.data, key), self.symbols)
+            if not changed(child.result, new):
+                return False
+        elif not child.patch(path[1:]):
+            return False
+        return self.update(self.compute())
+
+
+class LiveList(Live):
+    def __init__(self, node, data, symbols):
+        Live.__init__(self, node, data, symbols)
+        # Same xml hack as ListNode: data which isn't list-like is treated as a single-element list
+        self.wrapped = type(data) not in (list, tuple)
+        self.items = [data] if self.wrapped else data
+        index = node.index(self.items)
+        self.indexed = index is not None
+        self.tracked = []  # Per element template: whether its Lives are needed, or just its candidates
+        self.positions = []  # Per element template: sorted positions of the candidates (see ListNode.match)
+        self.lives = []  # Per element template: position -> Live
+        for element, element_selector in zip(node.elements, node.selectors):
+            if index is None or element_selector is None:
+                positions = list(range(len(self.items)))
+            else:
+                positions = list(index.positions(*element_selector))
+            tracked = relevant(element, symbols) or element.constrained
+            self.tracked.append(tracked)
+            self.positions.append(positions)
+            self.lives.append({p: live(element, self.items[p], symbols) for p in positions} if tracked else {})
+        self.result = self.compute()
+
+    def compute(self):
+        # Same as ListNode.match()/check(), from the candidates' results
+        partials = []
+        for element, positions, lives, failure in zip(self.node.elements, self.positions, self.lives,
+                                                      self.node.failures):
+            if not relevant(element, self.symbols):
+                # See ListNode.check_element
+                if not element.constrained:
+                    if not positions:
+                        return failure
+                elif not any(lives[p].result is None for p in positions):
+                    return failure
+                continue
+            matches = [lives[p].result for p in positions if type(lives[p].result) != NoMatch]
+            if not matches:
+                return failure
+            partials.append(concat(matches))
+        if not self.relevant:
+            return None
+        if not partials and self.node.elements:
+            return [{}]
+        return product(partials)
+
+    def patch(self, path):
+        if self.wrapped:
+            position, rest = 0, path
+        else:
+            position, rest = path[0], path[1:]
+            if position < 0:
+                position += len(self.items)
+        item = self.items[position]
+
+        any_changed = False
+        for element, element_selector, tracked, positions, lives in zip(self.node.elements, self.node.selectors,
+                                                                       self.tracked, self.positions, self.lives):
+            i = bisect_left(positions, position)
+            was_candidate = i < len(positions) and positions[i] == position
+            if self.indexed and element_selector is not None and not selects(element_selector, item):
+                # Patched out of the candidates
+                if was_candidate:
+                    del positions[i]
+                    lives.pop(position, None)
+                    any_changed = True
+                continue
+            if not was_candidate:
+                positions.insert(i, position)
+            elif tracked and rest:
+                any_changed = lives[position].patch(rest) or any_changed
+                continue
+            if tracked:
+                old = lives.get(position)
+                new = lives[position] = live(element, item, self.symbols)
+                any_changed = any_changed or old is None or changed(old.result, new)
+            else:
+                any_changed = any_changed or not was_candidate
+        if not any_changed:
+            return False
+        return self.update(self.compute())
+
+
+def selects(element_selector, item):
+    # Whether the LiteralIndex lookup for element_selector would include item
+    keys, values = element_selector
+    try:
+        return tuple(freeze(get_default(item, key)) for key in keys) == values
+    except TypeError:
+        return True
+
+
+live_types = {DictNode: LiveDict, ListNode: LiveList, NullableNode: LiveNullable}
+
+
+def live(node, data, symbols):
+    return live_types.get(type(node), LiveLeaf)(node, data, symbols)
+
+
+def parse_path(path):
+    # 'contacts[0].name' (the same paths as explain() reports) -> ['contacts', 0, 'name']. Paths can also be given as
+    # lists of keys, e.g. for keys with dots in them.
+    if type(path) != str:
+        return list(path)
+    return [int(position) if position else key for key, position in re.findall(r'([^.\[\]]+)|\[(-?\d+)\]', path)]
+
+
+def set_path(data, path, value):
+    target = data
+    for key in path[:-1]:
+        target = target[key] if type(target) in (dict, list, tuple) else get_default(target, key)
+    set_general(target, path[-1], value)
@@ -1,4 +1,9 @@
-from .simple import match_simple, NoMatchException
+from .compiled import NoMatch, compile_template, match_node
+from .lazy import count, values, project
+from .live import live, parse_path, set_path
+from .simple import everything
+
+from itertools import islice
 
 # See README for usage info
 
@@ -10,27 +15,143 @@ def match(template, data):
     return Match(template, data)
 
 def can_match(template, data):
-    # WARNING: THIS METHOD WILL COMPUTE ALL POSSIBLE MATCHES
-    try:
-        match_simple(template, data)
-    except NoMatchException:
-        return False
-    return True
+    return compile(template).can_match(data)
+
+def compile(template):
+    # Precompile a template which will be matched against many records. Passing a compiled template anywhere a
+    # template is expected by match() or can_match() skips all the per-call template inspection.
+    if type(template) == CompiledTemplate:
+        return template
+    return CompiledTemplate(template)
+
+
+class CompiledTemplate(object):
+    def __init__(self, template, wrap=None):
+        # See compile_template for wrap
+        self.template = template
+        self.root = compile_template(template, wrap)
+        self.symbols = self.root.symbols
+
+    def iter_matches(self, data, symbols=everything):
+        # Same results as simple.match_simple(self.template, data, symbols), but lazy: the data is checked against the
+        # template right away, and matches are only computed as they're consumed.
+        if not symbols:
+            # Corner case, never reached by recursion.
+            return iter([{}])
+        return iter(match_node(self.root, data, symbols))
+
+    def match_simple(self, data, symbols=everything):
+        return list(self.iter_matches(data, symbols))
+
+    def match(self, data):
+        return Match(self, data)
+
+    def can_match(self, data):
+        # Only checks the data against the template; doesn't enumerate any matches.
+        return type(self.root.match(data, everything)) != NoMatch
+
+    def __repr__(self):
+        return 'compile(' + repr(self.template) + ')'
 
 
 class Match(object):
     def __init__(self, template, data):
-        self.template = template
+        self.compiled = compile(template)
+        self.template = self.compiled.template
         self.data = data
+        self._factors = None
+        self._count = None
+        self._live = None  # symbols -> Live, once the data has been patched (see live.py)
+        self.indexes = None  # format()'s indexes (see format.Bindings), kept between calls once live
+
+    @property
+    def factors(self):
+        # The matches in factorized form (see lazy.py). Computed on first use, which is also when NoMatchException is
+        # raised if the data doesn't match.
+        if self._live is not None:
+            return self.live_result(everything)
+        if self._factors is None:
+            self._factors = match_node(self.compiled.root, self.data, everything)
+        return self._factors
+
+    def iter_matches(self, symbols):
+        # Same as self.compiled.iter_matches(self.data, symbols)
+        if self._live is None or not symbols:
+            return self.compiled.iter_matches(self.data, symbols)
+        if self.compiled.symbols.isdisjoint(symbols):
+            # Only checks the data; Lives don't do that at the top
+            return self.compiled.iter_matches(self.data, symbols)
+        return iter(self.live_result(symbols))
+
+    def live_result(self, symbols):
+        state = self._live.get(symbols)
+        if state is None:
+            state = self._live[symbols] = live(self.compiled.root, self.data, symbols)
+        if type(state.result) == NoMatch:
+            raise state.result.exception()
+        return state.result
+
+    def patch(self, path, value):
+        # Sets the data at path (e.g. 'contacts[0].name', or ['contacts', 0, 'name']) to value, in place, and brings
+        # the matches up to date. From the first patch on, the match is live (see live.py): each patch only re-matches
+        # the parts of the template on its path, and format() only recomputes the bindings which that could change.
+        path = parse_path(path)
+        if not path:
+            self.data = value
+        else:
+            set_path(self.data, path, value)
+        self._factors = None
+        self._count = None
+        if self._live is None or not path:
+            self._live = {}
+            self.indexes = {}
+            return
+        for symbols, state in self._live.items():
+            if state.patch(path):
+                self.indexes.pop(symbols, None)
+        for symbols in list(self.indexes):
+            if symbols not in self._live:
+                del self.indexes[symbols]
 
     # TODO: Work out a more coherent behavior for the standard methods on Match objects
     def __iter__(self):
-        return (m for m in match_simple(self.template, self.data))
+        return iter(self.factors)
+
+    def count(self):
+        # Number of distinct matches, computed from the factors rather than by listing them all
+        if self._count is None:
+            self._count = count(self.factors)
+        return self._count
+
+    def values(self, symbol):
+        # Distinct values of one symbol, in the order they first appear
+        return values(self.factors, symbol)
+
+    def project(self, symbols):
+        # All the distinct matches, restricted to the given symbols. The result stays in factorized form; it can be
+        # iterated over, and passed to lazy.count() etc.
+        return project(self.factors, symbols)
+
+    def to_columns(self, symbols=None, use_numpy=True):
+        # The matches as one column per symbol, rather than one dict per match (see columns.py)
+        from .columns import to_columns
+        return to_columns(self.factors, symbols, use_numpy)
 
     def __getitem__(self, item):
-        return match_simple(self.template, self.data, symbols=[item])[0]
+        for m in self.compiled.iter_matches(self.data, symbols=[item]):
+            return m
+        raise IndexError(item)
 
     def get_single(self):
-        # WARNING: THIS METHOD WILL COMPUTE ALL POSSIBLE MATCHES
-        # Todo: make match_simple an iterator, so methods like this one can be more efficient.
-        return match_simple(self.template, self.data)[0]
+        for m in self:
+            return m
+        raise IndexError('no matches')
+
+    def stats(self):
+        # Profile of matching this data against this template (see explain.py). Runs the match again, instrumented.
+        from .explain import explain
+        return explain(self.compiled, self.data)
+
+    def first(self, n):
+        # The first n matches (or fewer, if there aren't that many), without computing the rest.
+        return list(islice(self, n))
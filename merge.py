@@ -1,5 +1,6 @@
 from .simple import get_default
 from copy import deepcopy
+from heapq import merge as merge_sorted
 
 class MergeException(Exception):
     pass
@@ -16,28 +17,155 @@ def set_general(target, key, value):
 # TODO: next iteration of Regular should roll this capability directly into match/format
 # TODO: Check that merge() correctly handles Nullable & TransformationSymbol
 def merge(source, target):
+    # Merging happens in two steps: first work out every write the merge needs, without making any (so each list item
+    # can be tried against target items freely), then make them all. If anything doesn't match, nothing is written.
+    plan = Plan()
+    failure = plan_merge(source, target, plan)
+    if failure is not None:
+        raise failure.exception()
+    plan.apply()
+    if type(source) == list:
+        return
+    return target
+
+
+class Failure(object):
+    # Why a merge didn't match. The message (which includes the whole target list) is only built if it's raised.
+    __slots__ = ('source_item', 'target')
+
+    def __init__(self, source_item=None, target=None):
+        self.source_item = source_item
+        self.target = target
+
+    def exception(self):
+        if self.target is None:
+            return MergeException("No match!")
+        return MergeException("No match: " + str(self.source_item) + " vs " + str(self.target))
+
+MISMATCH = Failure()
+
+
+class Plan(object):
+    # The writes a merge will make. Reads go through the writes planned so far, so later parts of the source see the
+    # earlier parts as if they'd been merged already.
+    def __init__(self):
+        self.writes = []  # (target, key, value), in order
+        self.written = {}  # (id(target), key) -> value
+        self.undo = []  # (id(target), key, value it had in self.written before, if any), one per write
+        self.indexes = {}  # (id(target list), key) -> (target list, ListIndex)
+
+    def get(self, target, key):
+        value = self.written.get((id(target), key), _unset)
+        if value is _unset:
+            return get_default(target, key)
+        return value
+
+    def set(self, target, key, value):
+        pair = (id(target), key)
+        self.undo.append((pair, self.written.get(pair, _unset)))
+        self.written[pair] = value
+        self.writes.append((target, key, value))
+
+    def mark(self):
+        return len(self.writes)
+
+    def rollback(self, mark):
+        # Forget the writes planned since mark
+        while len(self.writes) > mark:
+            self.writes.pop()
+            pair, value = self.undo.pop()
+            if value is _unset:
+                del self.written[pair]
+            else:
+                self.written[pair] = value
+
+    def index(self, target, key):
+        cached = self.indexes.get((id(target), key))
+        if cached is None:
+            cached = self.indexes[(id(target), key)] = (target, ListIndex(target, key))
+        return cached[1]
+
+    def apply(self):
+        for target, key, value in self.writes:
+            set_general(target, key, value)
+
+_unset = object()
+
+
+def plan_merge(source, target, plan):
+    # Plans merging source into target. Returns None if they match, or a Failure (having planned nothing) if not.
     if type(source) == dict:
+        mark = plan.mark()
         for k in source:
-            new_target = get_default(target, k)
+            new_target = plan.get(target, k)
             if not new_target:
                 # Note: it should generally be assumed that the "source" for merge is a lists-and-dicts structure derived from a template, so deepcopy() works fine.
-                set_general(target, k, deepcopy(source[k]))
+                # Copied now rather than when applied, so anything merged into it later in the plan goes into the copy.
+                plan.set(target, k, deepcopy(source[k]))
             else:
-                merge(source[k], new_target)
+                failure = plan_merge(source[k], new_target, plan)
+                if failure is not None:
+                    plan.rollback(mark)
+                    return failure
+        return
     elif type(source) == list:
+        mark = plan.mark()
         for source_item in source:
-            found_match = False
-            for target_item in target:
-                try:
-                    # attempt match; error means no match
-                    merge(source_item, target_item)  # TODO: this will mess things up if it writes something and then hits a "no match"; need to check for match separately
-                    found_match = True
+            for target_item in candidates(source_item, target, plan):
+                if plan_merge(source_item, target_item, plan) is None:
                     break
-                except MergeException as e:
-                    continue
-            if not found_match:
-                raise MergeException("No match: " + str(source_item) + " vs " + str(target))
+            else:
+                plan.rollback(mark)
+                return Failure(source_item, target)
         return
     elif source != target:
-        raise MergeException("No match!")
-    return target
+        return MISMATCH
+
+
+INDEX_THRESHOLD = 8  # Shorter target lists are just scanned
+
+
+def candidates(source_item, target, plan):
+    # The target items source_item might merge into, in order. For long lists, only the items which agree with one of
+    # source_item's literal fields (see ListIndex) are tried.
+    if type(source_item) != dict or type(target) != list or len(target) < INDEX_THRESHOLD:
+        return target
+    best = None
+    for key, value in source_item.items():
+        if type(value) in (dict, list):
+            continue
+        try:
+            found = plan.index(target, key).get(value)
+        except TypeError:
+            # Unhashable
+            continue
+        if best is None or len(found) < len(best):
+            best = found
+    if best is None:
+        return target
+    return [target[i] for i in best]
+
+
+class ListIndex(object):
+    # Positions of a target list's items by their value for one key. Merging a literal only succeeds where the target
+    # has an equal value, or a falsy one (which gets overwritten); unhashable values are tried for every literal.
+    # This is built from the target as it is before the merge. Merging only ever fills in falsy values, so an item's
+    # position here is never wrong, just (for the falsy ones) less selective than it could be.
+    def __init__(self, target, key):
+        self.positions = {}
+        self.anything = []
+        for i, item in enumerate(target):
+            value = get_default(item, key)
+            if value:
+                try:
+                    self.positions.setdefault(value, []).append(i)
+                    continue
+                except TypeError:
+                    pass
+            self.anything.append(i)
+
+    def get(self, value):
+        found = self.positions.get(value, [])
+        if not self.anything:
+            return found
+        return list(merge_sorted(found, self.anything))
@@ -1,3 +1,6 @@
+from .analysis import has_symbols, template_resolvable, template_symbols
+from .frozen import freeze_match
+from .join import iter_join
 from .symbol import Nullable, TransSymbol
 
 class NoMatchException(Exception):
@@ -23,12 +26,25 @@ def get_default(obj, key):
         return None
 
 def unique(matches):
-    # TODO: write a not-terrible unique function. Requires recursively changing dicts to something hashable.
-    result = []
+    return list(iter_unique(matches))
+
+def iter_unique(matches, key=freeze_match):
+    # Order-preserving dedup, via a canonical hashable key for each match (see frozen.py).
+    seen = set()
+    memo = {}
+    unhashable = []
     for m in matches:
-        if not m in result:
-            result.append(m)
-    return result
+        try:
+            frozen = key(m, memo)
+        except TypeError:
+            # Some value can't be made hashable; fall back to comparing against the other matches in the same boat
+            if not m in unhashable:
+                unhashable.append(m)
+                yield m
+            continue
+        if frozen not in seen:
+            seen.add(frozen)
+            yield m
 
 def cartesian(partials):
     # Each 'partial' is a list of possible value maps for some subset of the symbols
@@ -45,20 +61,9 @@ def cartesian(partials):
         # TODO: refactor so it doesn't need special handling. Will probably involve uniqueing  earlier.
         return cartesian(partials[1:])
 
-    result = []
-    for remainder in cartesian(partials[1:]):
-        for candidate in partials[0]:
-            # If the two symbol sets have any symbols in common, then match on their values
-            # TODO: make this more efficient
-            common = set(remainder).intersection(candidate)
-            if {k: remainder[k] for k in common} != {k: candidate[k] for k in common}:
-                continue
-
-            # The "cartesian" part
-            full = {k:v for k,v in remainder.items()}
-            full.update(candidate)
-            result.append(full)
-    return result
+    # If the two symbol sets have any symbols in common, then match on their values (i.e. a join); otherwise it's the
+    # "cartesian" part.
+    return list(iter_join(cartesian(partials[1:]), partials[0]))
 
 def match_simple(template, data, symbols=everything):
     if not symbols:
@@ -76,7 +81,7 @@ def match_simple(template, data, symbols=everything):
 
     partials = []
     if type(template) == TransSymbol:
-        if symbols != everything and len(set(get_symbols(template)).intersection(symbols)) == 0:
+        if symbols != everything and not any(symbol in symbols for symbol in template_symbols(template)):
             # template does not contain any of the symbols we care about
             return []
         deduced_data = template._reverse(data)
@@ -115,17 +120,8 @@ def match_simple(template, data, symbols=everything):
     return unique(cartesian(partials))
 
 def get_symbols(template):
-    if type(template) == TransSymbol:
-        return get_symbols(template._symbol)
-    if hasattr(template, '__substitute__'):
-        return [template]
-    if type(template) == list:
-        return sum([get_symbols(v) for v in template], [])
-    if type(template) == dict:
-        return sum([get_symbols(v) for v in template.values()], [])
-    if type(template) == Nullable:
-        return get_symbols(template.contents)
-    return []
+    # See analysis.py
+    return list(template_symbols(template))
 
 def format_simple_single(template, values):
     if type(template) == dict:
@@ -134,16 +130,16 @@ def format_simple_single(template, values):
         return [format_simple_single(element, values) for element in template]
     elif type(template) == Nullable:
         result = format_simple_single(template.contents, values)
-        if get_symbols(result):
+        if has_symbols(result):
             return Nullable(result)
         return result
     elif type(template) == TransSymbol:
         if template in values:
             return values[template]
         result = format_simple_single(template._symbol, values)
-        if not get_symbols(result):
+        if not has_symbols(result):
             return template._forward(result)
-        return TransSymbol(result, template._forward, template._reverse)
+        return TransSymbol(result, template._forward, template._reverse, vectorized=template._vectorized)
 
     try:
         return template.__substitute__(values)
@@ -157,7 +153,24 @@ def format_simple_single(template, values):
 
     return template
 
+def resolve_symbols(template, values, resolvable=None):
+    # Symbols whose class has a __resolve__ method (i.e. SymbolicAddress) can look up their values in bulk, which is
+    # much cheaper than one __substitute__ at a time. Returns values, plus whatever they resolved. resolvable is
+    # template_resolvable(template), for callers which already have it (and can skip this call when it's empty).
+    pending = {}
+    for symbol in template_resolvable(template) if resolvable is None else resolvable:
+        if symbol not in values:
+            pending.setdefault(type(symbol).__resolve__, []).append(symbol)
+    if not pending:
+        return values
+
+    resolved = dict(values)
+    for resolve, symbols in pending.items():
+        resolved.update(resolve(symbols, values))
+    return resolved
+
 def format_simple(template, matches):
     if type(matches) == list:
-        return [format_simple_single(template, m) for m in matches]
-    return format_simple_single(template, matches)
+        resolvable = template_resolvable(template)
+        return [format_simple_single(template, resolve_symbols(template, m, resolvable)) for m in matches]
+    return format_simple_single(template, resolve_symbols(template, matches))
@@ -0,0 +1,198 @@
+from .batch import format_many
+from .format import format
+from .match import compile
+from .simple import NoMatchException
+
+from itertools import tee
+import argparse, importlib, json, re, sys
+
+# Streaming match -> format translation, for files too big to load: records are read, translated and written one at a
+# time. Input can be JSON lines, or a single top-level JSON array (which is parsed incrementally, not loaded whole).
+# Usage from the command line:
+#   python -m regular.stream mappings:los_template mappings:encompass_template export.json -o out.jsonl --errors bad.jsonl
+
+
+def iter_json_records(infile, chunk_size=65536):
+    # Yields the records in a JSON lines file, or the elements of a top-level JSON array, one at a time. A record which
+    # doesn't parse is an error as soon as it's been read, so memory stays bounded by the biggest record either way.
+    # Which of the two it is isn't known until the first non-whitespace character.
+    buffer, eof = '', False
+    while not eof and not buffer.strip():
+        more = infile.read(chunk_size)
+        buffer, eof = buffer + more, not more
+    pos = _skip_whitespace(buffer, 0)
+    if buffer[pos:pos + 1] == '[':
+        records = _iter_json_array(infile, buffer, pos + 1, eof, chunk_size)
+    else:
+        records = _iter_json_lines(infile, buffer, eof, chunk_size)
+    for record in records:
+        yield record
+
+
+def _iter_json_lines(infile, buffer, eof, chunk_size):
+    pieces = [buffer]  # Of the current line
+    number = 0
+    while pieces:
+        chunk = infile.read(chunk_size) if not eof else ''
+        eof = not chunk
+        lines = (''.join(pieces) + chunk).split('\n') if '\n' in chunk or eof else None
+        if lines is None:
+            pieces.append(chunk)
+            continue
+        pieces = [lines.pop()] if not eof else []
+        for line in lines:
+            number += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError('Line %d: %s' % (number, e))
+            yield record
+
+
+# A decode error with none of these after where it happened could just be a record cut off at the end of the buffer
+# (in the middle of a number, a literal or a \u escape); so could an unterminated string. Anything else is malformed.
+_separator = re.compile(r'[\s,:\[\]{}"]')
+
+
+def _iter_json_array(infile, buffer, pos, eof, chunk_size):
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = _next_char(infile, buffer, pos, eof, chunk_size)
+    number = 0
+    while number or buffer[pos:pos + 1] != ']':
+        if pos == len(buffer):
+            raise ValueError('Unterminated JSON array')
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if eof or (_separator.search(buffer, e.pos) and not e.msg.startswith('Unterminated string')):
+                raise
+            # Just a record which isn't all in the buffer yet. Read at least as much again as we have, so that
+            # retrying a big record is linear overall.
+            buffer, pos, eof = _read_more(infile, buffer, pos, max(chunk_size, len(buffer) - pos))
+            continue
+        if not eof and not _separator.search(buffer, end):
+            # A number at the end of the buffer might have been cut off (even as 1. of 1.5); make sure we've got all of
+            # it.
+            buffer, pos, eof = _read_more(infile, buffer, pos, chunk_size)
+            continue
+        yield record
+        number += 1
+
+        # Exactly one , or ] after each element (so [1 2], [1,,2] and [1,] are all errors)
+        buffer, pos, eof = _next_char(infile, buffer, end, eof, chunk_size)
+        separator = buffer[pos:pos + 1]
+        if separator == ']':
+            break
+        if not separator:
+            raise ValueError('Unterminated JSON array')
+        if separator != ',':
+            raise ValueError('Element %d: expecting , or ] after it' % number)
+        buffer, pos, eof = _next_char(infile, buffer, pos + 1, eof, chunk_size)
+
+    # Nothing but whitespace after the array
+    buffer, pos, eof = _next_char(infile, buffer, pos + 1, eof, chunk_size)
+    if pos < len(buffer):
+        raise ValueError('Extra data after the JSON array')
+
+
+def _next_char(infile, buffer, pos, eof, chunk_size):
+    # Skips whitespace, reading more as needed, up to the next character (or the end of the file)
+    pos = _skip_whitespace(buffer, pos)
+    while pos == len(buffer) and not eof:
+        buffer, pos, eof = _read_more(infile, buffer, pos, chunk_size)
+        pos = _skip_whitespace(buffer, pos)
+    return buffer, pos, eof
+
+
+def _skip_whitespace(buffer, pos):
+    while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+        pos += 1
+    return pos
+
+
+def _read_more(infile, buffer, pos, size):
+    # Drop everything we've already parsed, and read another chunk
+    more = infile.read(size)
+    return buffer[pos:] + more, 0, not more
+
+
+def translate(match_template, format_template, records, max_workers=0, chunksize=100):
+    # Yields (record, result) for each record, where result is the formatted record or the NoMatchException.
+    # With max_workers=0 everything happens in this process, one record at a time; otherwise see batch.format_many.
+    if max_workers == 0:
+        compiled = compile(match_template)
+        for record in records:
+            try:
+                yield record, format(format_template, compiled.match(record))
+            except NoMatchException as e:
+                yield record, e
+        return
+
+    records, originals = tee(records)
+    results = format_many(format_template, match_template, records, max_workers=max_workers, chunksize=chunksize)
+    for record, result in zip(originals, results):
+        yield record, result
+
+
+def translate_stream(match_template, format_template, infile, outfile, errfile=None, max_workers=0, chunksize=100):
+    # Reads records from infile, and writes each translated record to outfile as a JSON line. Records which don't match
+    # are written to errfile (if given) as they were read, also as JSON lines.
+    # Returns the number of records translated, and the number which didn't match.
+    translated = failed = 0
+    records = iter_json_records(infile)
+    for record, result in translate(match_template, format_template, records, max_workers, chunksize):
+        if type(result) == NoMatchException:
+            failed += 1
+            if errfile is not None:
+                errfile.write(json.dumps(record, default=str) + '\n')
+            continue
+        translated += 1
+        outfile.write(json.dumps(result, default=str) + '\n')
+    return translated, failed
+
+
+def load_object(path):
+    # 'package.module:name' -> the object called name in package.module
+    module_name, _, name = path.partition(':')
+    obj = importlib.import_module(module_name)
+    for attr in name.split('.'):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Translate a stream of JSON records with a pair of Regular templates.')
+    parser.add_argument('match_template', help='match template, as module:name')
+    parser.add_argument('format_template', help='format template, as module:name')
+    parser.add_argument('input', nargs='?', default='-', help='JSON lines, or a JSON array (default: stdin)')
+    parser.add_argument('-o', '--output', default='-', help='where to write translated records (default: stdout)')
+    parser.add_argument('--errors', help='where to write records which fail to match (default: drop them)')
+    parser.add_argument('--workers', type=int, default=0, help='worker processes (default: translate in-process)')
+    parser.add_argument('--chunksize', type=int, default=100, help='records per chunk sent to each worker')
+    args = parser.parse_args(argv)
+
+    files = []
+    def open_file(path, mode, default):
+        if path == '-':
+            return default
+        f = open(path, mode)
+        files.append(f)
+        return f
+
+    try:
+        infile = open_file(args.input, 'r', sys.stdin)
+        outfile = open_file(args.output, 'w', sys.stdout)
+        errfile = open_file(args.errors, 'w', None) if args.errors else None
+        translated, failed = translate_stream(load_object(args.match_template), load_object(args.format_template),
+                                              infile, outfile, errfile, args.workers, args.chunksize)
+    finally:
+        for f in files:
+            f.close()
+    sys.stderr.write('%d records translated, %d failed to match\n' % (translated, failed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
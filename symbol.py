@@ -1,3 +1,6 @@
+import contextvars, threading
+
+
 class S(str):
     # Symbol class: the only important difference between S and str is that S has a __substitute__ method
     # Note that S('a') == 'a' is True. This lets us use strings as shorthand in certain places.
@@ -15,27 +18,133 @@ def identity(x):
     return x
 
 
+# Set by format_async (see aio.py) while it runs: forward transformations go through it, so that batched ones can be
+# put off and run together. `collecting` is the number of format_async calls running anywhere, so that the rest of the
+# time, forward transformations only check that.
+collector = contextvars.ContextVar('collector', default=None)
+collecting = 0
+counting = threading.Lock()  # For collecting
+
+
+def start_collecting(deferred):
+    # Forward transformations in the current context go to deferred.forward(trans, value), until stop_collecting(token)
+    global collecting
+    with counting:
+        collecting += 1
+    return collector.set(deferred)
+
+
+def stop_collecting(token):
+    global collecting
+    collector.reset(token)
+    with counting:
+        collecting -= 1
+
+
 class TransSymbol(object):
     # A Symbol or SymbolicAddress with a transformation applied
-    # TODO: reverse transformation currently not applied during match. Use it.
-    def __init__(self, symbol, forward=identity, reverse=identity):
-        # Can either pass a single dict, or a pair of functions
+    # The reverse transformation is applied during match, to work out the value of the symbol inside (see also invert())
+    def __init__(self, symbol, forward=identity, reverse=identity, batch=None, cache=None, vectorized=None):
+        # Can either pass a single dict, or a pair of functions.
+        # batch is an async function taking a list of values and returning the list of their transformed values, which
+        # format_async calls once for all of a document's (or batch's) values. Without a forward function as well,
+        # plain format() runs it on one value at a time.
+        # cache is a number of results to keep (least recently used go first), for pure forward functions which see the
+        # same values over and over. Dicts don't need one.
+        # vectorized is a function taking a list of values (or a numpy array, for numbers) and returning a sequence of
+        # their transformed values. format() calls it once per list with all of the list's values (and Columns.apply
+        # once per column); anywhere else, unless there's a forward function as well, it gets one value at a time.
         self._symbol = symbol
+        self._batch = batch
+        self._vectorized = vectorized
+        self._cache = None
 
         self._map = None
         if type(forward) == dict:
-            reverse = {v:k for k,v in forward.items()}
+            # Bound methods rather than lambdas, so that templates can be pickled (e.g. to send to a process pool)
             # TODO: add option to fail on map miss
-            self._forward_func = lambda k: forward.get(k, None)
-            self._reverse = lambda k: reverse.get(k, None)
+            self._forward_func = self._map_forward
+            self._reverse = self._map_reverse
             self._map = forward
+            self._reverse_map = {v:k for k,v in forward.items()}
         else:
+            if forward is identity and batch is not None:
+                forward = self._run_batch
+            elif forward is identity and vectorized is not None:
+                forward = self._run_vectorized
             self._forward_func = forward
             self._reverse = reverse
+            if cache:
+                self._cache = cache
+                self._uncached = forward
+                self._forward_func = self._cached
+                self._lru = self._make_cache()
+
+    def _map_forward(self, k):
+        return self._map.get(k, None)
+
+    def _map_reverse(self, k):
+        return self._reverse_map.get(k, None)
+
+    def _run_batch(self, k):
+        import asyncio
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._batch([k]))[0]
+        raise RuntimeError(repr(self) + ' only has an async batch function, which format() can\'t run inside an event '
+                           'loop: use format_async, or give it a forward function as well')
+
+    def _run_vectorized(self, k):
+        return self._vectorize([k])[0]
+
+    def _vectorize(self, values):
+        # The vectorized function over values (a list or numpy array), as a list
+        results = self._vectorized(values)
+        results = results.tolist() if hasattr(results, 'tolist') else list(results)
+        if len(results) != len(values):
+            raise ValueError('%r returned %d results for %d values' % (self._vectorized, len(results), len(values)))
+        return results
+
+    def _make_cache(self):
+        import functools
+        return functools.lru_cache(maxsize=self._cache, typed=True)(self._uncached)
+
+    def _cached(self, k):
+        try:
+            hash(k)
+        except TypeError:
+            # Unhashable values don't get cached
+            return self._uncached(k)
+        return self._lru(k)
+
+    def __getstate__(self):
+        # The cache doesn't pickle, so the other side gets a fresh one
+        state = dict(self.__dict__)
+        state.pop('_lru', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._cache:
+            self._lru = self._make_cache()
 
     # Note that there is no corresponding wrapper for _reverse. This is a minor hack, and I haven't decided what behavior
     # I actually want here.
     def _forward(self, inner):
+        if collecting:
+            deferred = collector.get()
+            if deferred is not None:
+                return deferred.forward(self, inner)
+        if self._map is not None:
+            # Straight to the dict: a lookup can only fail on unhashable values, which are left as they are
+            try:
+                return self._map.get(inner)
+            except TypeError:
+                return inner
+        return self._apply(inner)
+
+    def _apply(self, inner):
         try:
             return self._forward_func(inner)
         except TypeError:
@@ -1,7 +1,8 @@
 from .format import format
+from .frozen import freeze
 from .match import match
-from .merge import merge
-from .simple import get_symbols
+from .merge import merge, MergeException
+from .simple import get_symbols, NoMatchException
 from .symbol import S, TransSymbol, Nullable
 
 from copy import deepcopy
@@ -9,6 +10,11 @@ from copy import deepcopy
 # See README for usage info
 
 
+# Each address keeps its children (by attribute, or by filter), and only builds its template (from its parent's) when
+# it's first needed. So a chain like application.borrower_profile.name is a few dict lookups after the first time, and
+# importing a module full of addresses doesn't build any templates at all.
+
+
 # Symbolic Address allows us to write things like application.borrower_profile.name, and translate it to the template
 # {borrower_profile: {name: S('application.borrower_profile.name')}}
 # without having to write it out.
@@ -21,24 +27,62 @@ class SymbolicAddress(object):
             name = base_name
         self._name = name
 
-        # contains the template itself
-        if path is None:
-            path = S(self._name)
-        self._path = path
+        # contains the template itself, once built (see _path)
+        self._path_template = path
 
-    def __getattr__(self, item):
-        name = self._name + '.' + item
-        path = format(self._path, {S(self._name): {item: S(name)}})
+        # Where this address came from: parent address, and the attribute/index used on it
+        self._parent = None
+        self._item = None
+        self._children = {}  # attribute, or (SymbolicListAddress, name, frozen filter) -> child address
 
-        return SymbolicAddress(self._base_name, name, path)
+    @property
+    def _path(self):
+        if self._path_template is None:
+            if self._parent is None:
+                self._path_template = S(self._name)
+            else:
+                self._path_template = replace_symbol(self._parent._path, self._parent._name, self._parent._wrap(self))
+        return self._path_template
+
+    def __getattr__(self, item):
+        if item[:2] == '__' and item[-2:] == '__':
+            # Introspection (hasattr(), copy, pickle...), not a field
+            raise AttributeError(item)
+        child = self._children.get(item)
+        if child is None:
+            child = self._child(SymbolicAddress(self._base_name, self._name + '.' + item), item)
+            if item[:1] != '_':
+                # Private names are still fields (e.g. _id), but aren't kept: they're mostly probes, as by IPython
+                self._children[item] = child
+        return child
 
     def __getitem__(self, item):
         if type(item) not in set([dict, list]):
             return self.__getattr__(item)
 
         name = self._name + '[' + str(item) + ']'
-        path = format(self._path, {S(self._name): S(name)})
-        return SymbolicListAddress(self._base_name, name, path, filter=item)
+        try:
+            key = (SymbolicListAddress, name, freeze(item))
+        except TypeError:
+            # Can't keep this one
+            key = None
+        child = self._children.get(key) if key is not None else None
+        if child is None:
+            child = self._child(SymbolicListAddress(self._base_name, name, filter=item), item)
+            if key is not None:
+                self._children[key] = child
+        return child
+
+    def _child(self, child, item):
+        child._parent = self
+        child._item = item
+        return child
+
+    def _wrap(self, child):
+        # What S(self._name) turns into in child's template
+        if type(child) == SymbolicListAddress:
+            return S(child._name)
+        return {child._item: S(child._name)}
 
     def __eq__(self, other):
         if hasattr(other, '_name'):
@@ -61,6 +105,37 @@ class SymbolicAddress(object):
         # Second, actually follow address
         return match(self._path, values[self._base_name]).get_single()[self._name]
 
+    @classmethod
+    def __resolve__(cls, addresses, values):
+        # Follow many addresses at once (see simple.resolve_symbols). Addresses with the same base are merged into one
+        # template, as in get_expansion, so the base object is matched once rather than once per address.
+        # Anything which can't be resolved that way is left to __substitute__, so errors come out the same as ever.
+        addresses = [a for a in addresses if type(a) == SymbolicAddress and a._base_name in values]
+        prefixes = set()
+        for address in addresses:
+            name = address._name
+            prefixes.update(name[:i] for i in range(len(name)) if name[i] in '.[')
+        # An address which is a prefix of another (e.g. app.profile and app.profile.name) can't go in the same
+        # template, so those get a separate pass.
+        ancestors = [a for a in addresses if a._name in prefixes]
+        by_base = {}
+        for address in addresses:
+            if address._name not in prefixes:
+                by_base.setdefault(address._base_name, []).append(address)
+
+        resolved = {}
+        for base_name, group in by_base.items():
+            try:
+                m = match(SymbolicAddress.get_expansion(group), values).get_single()
+            except (NoMatchException, MergeException, IndexError):
+                continue
+            for address in group:
+                if address in m:
+                    resolved[address] = m[address]
+        if ancestors:
+            resolved.update(cls.__resolve__(ancestors, values))
+        return resolved
+
     @staticmethod
     def get_expansion(mapping):
         # Take a mapping which contains symbolic addresses, and construct an explicit map for parsing the symbolic addresses
@@ -91,13 +166,10 @@ class SymbolicListAddress(SymbolicAddress):
         self._filter = kwargs.pop('filter', None)
         super().__init__(*args, **kwargs)
 
-    def __getattr__(self, item):
-        name = self._name + '.' + item
+    def _wrap(self, child):
         filter = deepcopy(self._filter)
-        filter[item] = S(name)
-        path = format(self._path, {S(self._name): [filter]})
-
-        return SymbolicAddress(self._base_name, name, path)
+        filter[child._item] = S(child._name)
+        return [filter]
 
     # TODO: Handle repeat list indexes (i.e. indexing lists of lists). Using SymbolicAddress for this would be so awkward that I doubt anyone will do it for a while.
     def __getitem__(self, item):
@@ -110,3 +182,14 @@ class SymbolicListAddress(SymbolicAddress):
     # Could be simplified by refactoring format() to replace all lists with symbols, and resolve them separately. The same helper used for that could then be used here.
     def __substitute__(self, values):
         raise NotImplementedError
+
+
+def replace_symbol(template, name, replacement):
+    # Copy of an address template, with the symbol called name replaced
+    if hasattr(template, '__substitute__'):
+        return replacement if template == name else template
+    if type(template) == dict:
+        return {k: replace_symbol(v, name, replacement) for k, v in template.items()}
+    if type(template) == list:
+        return [replace_symbol(v, name, replacement) for v in template]
+    return template
@@ -189,6 +189,30 @@ class TestFull(unittest.TestCase):
             err = e
         self.assertIsNotNone(err)
 
+    # Test 13: Nested list formats are grouped from a single pass over the data
+    @responses.activate
+    def test_nested_grouping(self):
+        data = [{'name': 'john', 'addresses': [{'state': 'CA', 'city': 'LA'}, {'state': 'CT', 'city': 'Hartford'}]},
+                {'name': 'allan', 'addresses': [{'state': 'CA', 'city': 'SF'}, {'state': 'WA', 'city': 'Seattle'}]},
+                {'name': 'abe', 'addresses': [{'state': 'CA', 'city': 'LA'}]}]
+        match_template = [{'name': S('name'), 'addresses': [{'state': S('state'), 'city': S('city')}]}]
+        format_template = [{'state': S('state'), 'cities': [{'city': S('city'), 'names': [S('name')]}]}]
+        expected = [{'state': 'CA', 'cities': [{'city': 'LA', 'names': ['john', 'abe']}, {'city': 'SF', 'names': ['allan']}]},
+                    {'state': 'CT', 'cities': [{'city': 'Hartford', 'names': ['john']}]},
+                    {'state': 'WA', 'cities': [{'city': 'Seattle', 'names': ['allan']}]}]
+
+        m = match(match_template, data)
+        self.assertEqual(format(format_template, m), expected)
+
+        # Big enough that re-matching the whole data for every group would take a long while
+        data = [{'name': str(i), 'addresses': [{'state': str(i % 500), 'city': str(i % 7)}]} for i in range(5000)]
+        result = format(format_template, match(match_template, data))
+        self.assertEqual(len(result), 500)
+        cities = {}
+        for i in range(3, 5000, 500):
+            cities.setdefault(str(i % 7), []).append(str(i))
+        self.assertEqual(result[3], {'state': '3', 'cities': [{'city': c, 'names': n} for c, n in cities.items()]})
+
 
 if __name__ == '__main__':
     unittest.main()
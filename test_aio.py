@@ -0,0 +1,81 @@
+import responses
+from .aio import format_async, format_many_async
+from .format import format
+from .match import match
+from .simple import NoMatchException
+from .symbol import S, TransSymbol as Trans
+
+import asyncio, unittest
+
+
+class Service(object):
+    # A fake lookup service, which records what it's asked for
+    def __init__(self, lookup):
+        self.lookup = lookup
+        self.calls = []
+
+    async def __call__(self, values):
+        self.calls.append(list(values))
+        await asyncio.sleep(0)
+        return [self.lookup(v) for v in values]
+
+
+match_template = {'id': S('id'), 'kind': S('kind'), 'people': [{'name': S('name'), 'city': S('city')}]}
+data = {'id': 1, 'kind': 'F', 'people': [{'name': 'al', 'city': 'sf'}, {'name': 'bo', 'city': 'sf'},
+                                         {'name': 'al', 'city': 'la'}]}
+
+
+class TestAio(unittest.TestCase):
+    # Test 1: One call per batch function, with each distinct value once, and the same result as format()
+    @responses.activate
+    def test_format_async(self):
+        upper = Service(lambda v: v.upper())
+        codes = Service({'F': 'fixed', 'A': 'arm'}.get)
+        template = {'id': S('id'), 'kind': Trans(S('kind'), batch=codes),
+                    'people': [{'name': Trans(S('name'), batch=upper), 'city': Trans(S('city'), batch=upper),
+                                'initial': Trans(Trans(S('name'), batch=upper), lambda v: v[0])}]}
+        result = asyncio.run(format_async(template, match(match_template, data)))
+        self.assertEqual(result, {'id': 1, 'kind': 'fixed', 'people': [
+            {'name': 'AL', 'city': 'SF', 'initial': 'A'}, {'name': 'BO', 'city': 'SF', 'initial': 'B'},
+            {'name': 'AL', 'city': 'LA', 'initial': 'A'}]})
+        self.assertEqual(codes.calls, [['F']])
+        self.assertEqual(upper.calls, [['al', 'sf', 'bo', 'la']])
+
+        # Without format_async, batch functions get one value at a time
+        upper.calls, codes.calls = [], []
+        self.assertEqual(format(template, match(match_template, data)), result)
+        self.assertEqual(len(upper.calls), 9)
+        self.assertTrue(all(len(values) == 1 for values in upper.calls))
+
+        # ... which they can't do inside an event loop
+        async def inside(template):
+            return format(template, match(match_template, data))
+        with self.assertRaisesRegex(RuntimeError, 'format_async'):
+            asyncio.run(inside(template))
+        # unless there's a forward function too
+        self.assertEqual(asyncio.run(inside({'kind': Trans(S('kind'), lambda v: v.lower(), batch=codes)})), {'kind': 'f'})
+
+    # Test 2: Calls shared across records; batched transformations of batched values take another round
+    @responses.activate
+    def test_format_many_async(self):
+        upper = Service(lambda v: v.upper())
+        codes = Service({'F': 'fixed', 'A': 'arm'}.get)
+        template = {'id': S('id'), 'kind': Trans(Trans(S('kind'), batch=codes), batch=upper),
+                    'names': [Trans(S('name'), batch=upper)]}
+        other = {'id': 2, 'kind': 'A', 'people': [{'name': 'al', 'city': 'ny'}]}
+        results = asyncio.run(format_many_async(template, match_template, [data, {'people': []}, other]))
+        self.assertEqual(results[0], {'id': 1, 'kind': 'FIXED', 'names': ['AL', 'BO']})
+        self.assertEqual(type(results[1]), NoMatchException)
+        self.assertEqual(results[2], {'id': 2, 'kind': 'ARM', 'names': ['AL']})
+        self.assertEqual(codes.calls, [['F', 'A']])
+        self.assertEqual(upper.calls, [['al', 'bo'], ['fixed', 'arm']])
+
+        # Batch functions have to give one result per value
+        async def broken(values):
+            return values[1:]
+        with self.assertRaises(ValueError):
+            asyncio.run(format_async({'names': [Trans(S('name'), batch=broken)]}, match(match_template, data)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import responses
+from .batch import match_many, format_many
+from .simple import NoMatchException
+from .symbol import S, TransSymbol as Trans
+
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+
+
+match_template = {'kind': 'person', 'name': S('name'), 'state': Trans(S('state'), {'CA': 'California', 'WA': 'Washington'}),
+                  'tags': [S('tag')]}
+format_template = {'person': S('name'), 'state': S('state'), 'tags': [S('tag')]}
+records = [{'kind': 'person', 'name': 'p' + str(i), 'state': 'California' if i % 2 else 'Washington', 'tags': ['a', 'b']}
+           for i in range(250)]
+records[17] = {'kind': 'robot', 'name': 'nobody'}
+expected = [{'person': r['name'], 'state': 'CA' if i % 2 else 'WA', 'tags': ['a', 'b']} for i, r in enumerate(records)]
+
+
+class TestBatch(unittest.TestCase):
+    def check(self, results):
+        results = list(results)
+        self.assertEqual(len(results), len(records))
+        self.assertIsInstance(results[17], NoMatchException)
+        self.assertEqual(results[:17] + results[18:], expected[:17] + expected[18:])
+        return results
+
+    # Test 1: Process pool, with results in input order and failures reported per record
+    @responses.activate
+    def test_format_many(self):
+        results = self.check(format_many(format_template, match_template, records, max_workers=2, chunksize=16))
+        # Failures come back the same way as in-process
+        in_process = self.check(format_many(format_template, match_template, records, max_workers=0))
+        self.assertEqual(results[17].args, in_process[17].args)
+
+    # Test 2: In-process, and with a caller-supplied executor
+    @responses.activate
+    def test_format_many_executors(self):
+        self.check(format_many(format_template, match_template, records, max_workers=0))
+        with ThreadPoolExecutor(2) as executor:
+            self.check(format_many(format_template, match_template, records, executor=executor, chunksize=7))
+
+        # Batches sharing an executor, at the same time
+        with ThreadPoolExecutor(4) as executor:
+            batches = [format_many({'n': S('name')}, {'name': S('name')}, records, executor=executor, chunksize=3),
+                       format_many({'m': S('name')}, {'name': S('name')}, records, executor=executor, chunksize=5)]
+            for n, m in zip(*batches):
+                self.assertEqual(n['n'], m['m'])
+
+    # Test 3: match_many gives the full list of matches for each record
+    @responses.activate
+    def test_match_many(self):
+        results = list(match_many({'kind': 'person', 'tags': [S('tag')]}, records, max_workers=2))
+        self.assertEqual(results[0], [{S('tag'): 'a'}, {S('tag'): 'b'}])
+        self.assertIsInstance(results[17], NoMatchException)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import responses
+from .bench import compare, run_all, workloads
+
+import unittest
+
+
+class TestBench(unittest.TestCase):
+    # Test 1: Every workload runs, and reports a time and peak memory
+    @responses.activate
+    def test_run_all(self):
+        results = run_all(scale=0.05, repeat=1)
+        self.assertEqual(sorted(results), sorted(name for name, workload in workloads))
+        for result in results.values():
+            self.assertGreater(result['time'], 0)
+            self.assertGreater(result['peak'], 0)
+
+        results = run_all(scale=0.05, repeat=1, only=['join'])
+        self.assertEqual(list(results), ['join'])
+
+    # Test 2: Comparing against a baseline
+    @responses.activate
+    def test_compare(self):
+        baseline = {'a': {'time': 1.0, 'peak': 100}, 'b': {'time': 1.0, 'peak': 100}, 'gone': {'time': 1.0, 'peak': 1}}
+        results = {'a': {'time': 1.1, 'peak': 100}, 'b': {'time': 1.0, 'peak': 150}, 'new': {'time': 1.0, 'peak': 1}}
+        self.assertEqual(compare(results, baseline), [('a', 1.1, 1.0, False), ('b', 1.0, 1.5, True)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import responses
+from .codegen import codegen, invert
+from .format import format
+from .match import match
+from .simple import NoMatchException
+from .symbol import S, Nullable, TransSymbol as Trans
+
+import io, random, unittest
+
+
+def translate(function, data):
+    try:
+        return function(data)
+    except NoMatchException:
+        return 'no match'
+
+
+def comparable(value):
+    # Nullables and TransSymbols left in the output (for symbols without values) don't compare equal
+    if type(value) == dict:
+        return {k: comparable(v) for k, v in value.items()}
+    elif type(value) == list:
+        return [comparable(v) for v in value]
+    elif type(value) == Nullable:
+        return ('Nullable', comparable(value.contents))
+    elif type(value) == Trans:
+        return ('Trans', comparable(value._symbol))
+    return value
+
+
+match_template = {'loan': {'id': S('id'), 'amount': S('amount'),
+                           'kind': Nullable({'name': S('kind'), 'active': True})},
+                  'people': [{'role': 'borrower', 'name': S('name'), 'age': S('age')},
+                             Nullable({'role': 'cosigner', 'name': S('cosigner')})],
+                  'tags': [S('tag')], 'flags': [{'on': True}]}
+
+# Format templates, and whether the generated code handles them itself
+format_templates = [
+    ({'id': S('id'), 'names': [S('name')], 'ages': [{'age': S('age'), 'names': [S('name')]}],
+      'kind': Nullable(S('kind'))}, True),
+    ([{'name': S('name'), 'tags': [S('tag')], 'id': S('id')}, 'literal', {'kind': S('kind')}], True),
+    ({'first': S('name'), 'cosigners': [S('cosigner')], 'tag': Trans(S('tag'), str),
+      'next': [Trans(S('id'), lambda v: (v or 0) + 1)], 'constants': [1, (2, 3)]}, True),
+    ({'amount': S('amount'), 'lists': [[S('tag')], {'cosigner': S('cosigner'), 'again': [S('cosigner')]}]}, True),
+    # Symbols from two different lists in the same list element
+    ([{'tag': S('tag'), 'name': S('name')}], False),
+]
+
+
+def random_data(rnd):
+    value = lambda: rnd.choice([1, 2, 'x', None, [1], {'a': 1}, 1.0, True])
+    data = {'loan': {'id': rnd.randint(1, 3), 'amount': value(),
+                     'kind': rnd.choice([{'name': 'fixed', 'active': True}, {'name': 'arm', 'active': False}, None])},
+            'people': [{'role': rnd.choice(['borrower', 'borrower', 'cosigner', 'other']),
+                        'name': rnd.choice(['al', 'bo', None]), 'age': rnd.choice([20, 21, {'years': 1}])}
+                       for i in range(rnd.randint(0, 8))],
+            'tags': [value() for i in range(rnd.randint(0, 4))],
+            'flags': [{'on': rnd.choice([True, False])} for i in range(rnd.randint(0, 3))]}
+    if rnd.random() < 0.1:
+        data['people'] = {'role': 'borrower', 'name': 'solo', 'age': 30}
+    if rnd.random() < 0.05:
+        del data['loan']
+    return data
+
+
+class TestCodegen(unittest.TestCase):
+    # Test 1: Same output (or NoMatchException) as format(match()), with the engine as the reference
+    @responses.activate
+    def test_against_engine(self):
+        rnd = random.Random(0)
+        for format_template, specialized in format_templates:
+            translator = codegen(match_template, format_template)
+            self.assertEqual(translator.specialized, specialized)
+            for trial in range(200):
+                data = random_data(rnd)
+                expected = translate(lambda d: format(format_template, match(match_template, d)), data)
+                self.assertEqual(comparable(translate(translator, data)), comparable(expected))
+
+    # Test 2: The generated source
+    @responses.activate
+    def test_source(self):
+        translator = codegen({'contacts': [{'type': 'contractor', 'name': S('name')}], 'id': S('id')},
+                             {'loan': S('id'), 'contractors': [S('name')]})
+        self.assertIn('def translate(data):', translator.source)
+        self.assertIn("if 'contractor' != ", translator.source)
+        out = io.StringIO()
+        translator.dump(out)
+        self.assertEqual(out.getvalue(), translator.source)
+
+        data = {'id': 7, 'contacts': [{'type': 'contractor', 'name': 'bob'}, {'type': 'borrower', 'name': 'al'},
+                                      {'type': 'contractor', 'name': 'cy'}]}
+        self.assertEqual(translator(data), {'loan': 7, 'contractors': ['bob', 'cy']})
+        self.assertEqual(translator.function(data), translator(data))
+        with self.assertRaises(NoMatchException):
+            translator({'id': 7, 'contacts': []})
+
+        # Joins aren't specialized, but still give the engine's results
+        joins = codegen({'names': [{'ssn': S('ssn'), 'name': S('name')}],
+                         'hats': [{'ssn': S('ssn'), 'color': S('color')}]},
+                        [{'name': S('name'), 'color': S('color'), 'ssn': S('ssn')}])
+        self.assertFalse(joins.specialized)
+        self.assertEqual(joins({'names': [{'ssn': 1, 'name': 'mario'}], 'hats': [{'ssn': 1, 'color': 'red'}]}),
+                         [{'name': 'mario', 'color': 'red', 'ssn': 1}])
+
+    # Test 3: Reverse mappings, which apply the TransSymbols' reverse functions (and maps) while matching
+    @responses.activate
+    def test_invert(self):
+        los = {'loan': {'id': S('id'), 'kind': S('kind'), 'rate': S('rate')},
+               'borrowers': [{'name': S('name'), 'age': S('age')}]}
+        db = {'LoanId': Trans(S('id'), str, lambda v: int(v) if type(v) == str and v.isdigit() else v),
+              'Kind': Trans(S('kind'), {'fixed': 'F', 'arm': 'A'}),
+              'Borrowers': [{'Name': Trans(S('name'), lambda v: v.upper(), lambda v: v.lower()), 'Age': S('age')}]}
+        data = {'loan': {'id': 5, 'kind': 'arm', 'rate': 4.5},
+                'borrowers': [{'name': 'mario', 'age': 30}, {'name': 'luigi', 'age': 28}]}
+        forward, reverse = codegen(los, db), invert(los, db)
+        self.assertTrue(forward.specialized and reverse.specialized)
+        self.assertEqual(forward(data), {'LoanId': '5', 'Kind': 'A', 'Borrowers': [{'Name': 'MARIO', 'Age': 30},
+                                                                                   {'Name': 'LUIGI', 'Age': 28}]})
+        # rate isn't in db, so it stays a symbol, as it would with format()
+        self.assertEqual(reverse(forward(data)), {'loan': {'id': 5, 'kind': 'arm', 'rate': S('rate')},
+                                                  'borrowers': data['borrowers']})
+
+        rnd = random.Random(0)
+        for trial in range(200):
+            record = {'LoanId': rnd.choice(['5', 'x', None]), 'Kind': rnd.choice(['F', 'A', 'Q', None]),
+                      'Borrowers': [{'Name': rnd.choice(['MARIO', 'Mario']), 'Age': rnd.choice([30, 31])}
+                                    for i in range(rnd.randint(0, 4))]}
+            expected = translate(lambda d: format(los, match(db, d)), record)
+            self.assertEqual(comparable(translate(reverse, record)), comparable(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import responses
+from .columns import column
+from .match import match
+from .symbol import S, Nullable, TransSymbol as Trans
+
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+people = [{'id': i, 'name': 'name' + str(i), 'age': 20 + i % 50, 'pet': {'kind': 'dog'} if i % 3 else None}
+          for i in range(1000)]
+template = [{'id': S('id'), 'name': S('name'), 'age': S('age'), 'pet': Nullable({'kind': S('kind')})}]
+
+
+@unittest.skipUnless(numpy, 'numpy is not installed')
+class TestColumns(unittest.TestCase):
+    # Test 1: One column per symbol, with numpy arrays for numbers
+    @responses.activate
+    def test_to_columns(self):
+        m = match(template, people)
+        columns = m.to_columns()
+        self.assertEqual(len(columns), 1000)
+        self.assertEqual(type(columns[S('age')]), numpy.ndarray)
+        self.assertEqual(type(columns[S('name')]), list)
+        self.assertEqual(columns[S('kind')][:3], [None, 'dog', 'dog'])
+        self.assertEqual(columns[S('age')].sum(), sum(p['age'] for p in people))
+        # Same matches, with None for symbols which weren't bound
+        self.assertEqual(list(columns), [dict({S('kind'): None}, **row) for row in m])
+
+        columns = m.to_columns([S('age')], use_numpy=False)
+        self.assertEqual(list(columns.columns), [S('age')])
+        self.assertEqual(columns[S('age')], list(range(20, 70)))
+
+        self.assertEqual(type(column([1.0, 2.5])), numpy.ndarray)
+        self.assertEqual(column([True, False]).dtype, bool)
+        self.assertEqual(column([1, 2 ** 70]), [1, 2 ** 70])
+        # Mixed types stay as they are, rather than all becoming floats
+        self.assertEqual(column([1, 2.5]), [1, 2.5])
+        m = match([{'id': S('id')}], [{'id': 2 ** 60 + 1}, {'id': 0.5}])
+        self.assertEqual(list(m.to_columns()), list(m))
+        self.assertEqual(m.to_columns()[S('id')][0], 2 ** 60 + 1)
+        self.assertEqual(column([1, None]), [1, None])
+
+    # Test 2: Filters and joins over whole columns
+    @responses.activate
+    def test_filter_and_join(self):
+        columns = match(template, people).to_columns()
+        old = columns.filter(columns[S('age')] >= 65)
+        self.assertEqual(list(old[S('id')]), [p['id'] for p in people if p['age'] >= 65])
+        self.assertEqual(old[S('name')], [p['name'] for p in people if p['age'] >= 65])
+
+        hats = [{'id': i % 20, 'hat': 'hat' + str(i)} for i in range(40)] + [{'id': 5000, 'hat': 'lost'}]
+        hat_columns = match([{'id': S('id'), 'hat': S('hat')}], hats).to_columns()
+        joined = old.join(hat_columns)
+        expected = [(p['id'], h['hat']) for p in people if p['age'] >= 65 for h in hats if h['id'] == p['id']]
+        self.assertEqual(list(zip(joined[S('id')].tolist(), joined[S('hat')])), expected)
+
+        # Joining on non-numeric columns, and without numpy
+        for use_numpy in [True, False]:
+            names = match(template, people[:30]).to_columns(use_numpy=use_numpy)
+            nicknames = match([{'name': S('name'), 'nick': S('nick')}],
+                              [{'name': 'name' + str(i), 'nick': 'n' + str(i)} for i in range(0, 60, 2)]).to_columns()
+            joined = names.join(nicknames)
+            self.assertEqual(list(joined[S('nick')]), ['n' + str(i) for i in range(0, 30, 2)])
+            self.assertEqual(len(names.join(nicknames, on=[])), 30 * 30)
+
+        # Bulk transforms
+        double = Trans(S('age'), lambda age: age * 2)
+        doubled = columns.apply(double)
+        self.assertEqual(doubled[double].tolist(), [2 * p['age'] for p in people])
+        halve = Trans(S('age'), vectorized=lambda ages: ages / 2)
+        self.assertEqual(columns.apply(halve)[halve].tolist(), [p['age'] / 2 for p in people])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,257 @@
+import responses
+from .lazy import count
+from .match import compile, match, can_match
+from .simple import match_simple, NoMatchException
+from .symbol import S, Nullable, TransSymbol as Trans, identity
+
+import unittest
+
+
+people = [{'name': 'john', 'addresses': [{'state': 'CA'}, {'state': 'CT'}]},
+          {'name': 'allan', 'addresses': [{'state': 'CA'}, {'state': 'WA'}]}]
+join_data = {'names': [{'ssn': 123456789, 'name': 'mario'}, {'ssn': 987654321, 'name': 'luigi'}],
+             'hats': [{'ssn': 123456789, 'hat_color': 'red'}, {'ssn': 987654321, 'hat_color': 'green'}]}
+
+# (template, data) pairs covering each node type; the compiled engine must agree exactly with match_simple on all of them
+cases = [
+    ({'name': S('name')}, {'name': 'john'}),
+    ([{'name': S('name')}], [{'name': 'john'}, {'name': 'abe'}]),
+    ([{'name': S('name'), 'addresses': [{'state': S('state')}]}], people),
+    ([{'name': S('name'), 'state': 'WA'}], [{'name': 'john', 'state': 'CT'}, {'name': 'allan', 'state': 'WA'}]),
+    ([{'addresses': [{'state': 'CT'}], 'name': S('name')}], people),
+    ({'u': [S('u')], 'v': [S('v')]}, {'u': [1, 2], 'v': [3, 4]}),
+    ({'person': Nullable([{'name': S('name')}]), 'state': S('state')}, {'state': 'CA'}),
+    ({'state': Trans(S('state'), {'CA': 'California'})}, {'state': 'California'}),
+    ({'names': [{'ssn': S('ssn'), 'name': S('name')}], 'hats': [{'ssn': S('ssn'), 'hat_color': S('color')}]}, join_data),
+    ({'contacts': [{'type': 'contractor', 'phone': S('phone')}]}, {'contacts': {'type': 'contractor', 'phone': '555'}}),
+    ({'a': 1, 'b': 2}, {'a': 1, 'b': 2}),
+]
+
+
+class TestCompiled(unittest.TestCase):
+    # Test 1: Same results as match_simple, with and without a symbol subset
+    @responses.activate
+    def test_same_as_match_simple(self):
+        for template, data in cases:
+            compiled = compile(template)
+            self.assertEqual(compiled.match_simple(data), match_simple(template, data))
+            for symbol in compiled.symbols:
+                self.assertEqual(compiled.match_simple(data, [symbol]), match_simple(template, data, [symbol]))
+            self.assertEqual(compiled.match_simple(data, []), match_simple(template, data, []))
+            self.assertEqual(compiled.match_simple(data, [S('other')]), match_simple(template, data, [S('other')]))
+
+    # Test 2: One compiled template, many records
+    @responses.activate
+    def test_reuse(self):
+        compiled = compile({'name': S('name'), 'state': 'CA'})
+        self.assertEqual(compiled.match({'name': 'john', 'state': 'CA'}).get_single(), {S('name'): 'john'})
+        self.assertEqual(compiled.match({'name': 'abe', 'state': 'CA'}).get_single(), {S('name'): 'abe'})
+        self.assertFalse(compiled.can_match({'name': 'allan', 'state': 'WA'}))
+        self.assertFalse(can_match(compiled, {'name': 'allan', 'state': 'WA'}))
+
+    # Test 3: match() accepts compiled templates, and compiling twice is a no-op
+    @responses.activate
+    def test_match_accepts_compiled(self):
+        template, data = cases[2]
+        compiled = compile(template)
+        self.assertIs(compile(compiled), compiled)
+        self.assertEqual(list(match(compiled, data)), list(match(template, data)))
+        self.assertIs(match(compiled, data).template, template)
+
+    # Test 4: Lazy matching; the full product here has 100**8 rows
+    @responses.activate
+    def test_lazy(self):
+        keys = 'abcdefgh'
+        data = {k: list(range(100)) for k in keys}
+        template = {k: [S(k)] for k in keys}
+
+        m = match(template, data)
+        self.assertEqual(m.get_single(), {S(k): 0 for k in keys})
+        self.assertEqual(m.first(3), [dict({S(k): 0 for k in keys}, a=i) for i in range(3)])
+        self.assertEqual(m['h'], {S('h'): 0})
+        self.assertTrue(can_match(template, data))
+
+    # Test 5: Lazy results come out in the same order as match_simple
+    @responses.activate
+    def test_lazy_order(self):
+        for template, data in cases:
+            m = match(template, data)
+            expected = match_simple(template, data)
+            self.assertEqual(list(m), expected)
+            self.assertEqual(m.first(2), expected[:2])
+
+    # Test 6: Counting, reading off values and projecting straight from the factors
+    @responses.activate
+    def test_factorized(self):
+        data = {'x': list(range(1000)), 'y': list(range(1000)), 'z': [{'w': 1}, {'w': 2}, {'w': 1}]}
+        m = match({'x': [S('x')], 'y': [S('y')], 'z': [{'w': S('w')}]}, data)
+        self.assertEqual(m.count(), 2000000)
+        # Truthiness doesn't depend on the matches, even where there are none to list, or the data doesn't match
+        self.assertTrue(match({'a': 1}, {'a': 1}))
+        self.assertTrue(match({'a': 1}, {'a': 2}))
+        self.assertEqual(m.values('w'), [1, 2])
+        self.assertEqual(m.values('x'), list(range(1000)))
+        projected = m.project([S('x'), S('w')])
+        self.assertEqual(count(projected), 2000)
+        self.assertEqual(list(projected)[:3], [{S('x'): 0, S('w'): 1}, {S('x'): 1, S('w'): 1}, {S('x'): 2, S('w'): 1}])
+
+    # Test 7: Factorized results agree with the full list of matches
+    @responses.activate
+    def test_factorized_same_as_match_simple(self):
+        for template, data in cases:
+            m = match(template, data)
+            expected = match_simple(template, data)
+            self.assertEqual(m.count(), len(expected))
+            for symbol in m.compiled.symbols:
+                expected_values = []
+                for row in expected:
+                    if symbol in row and row[symbol] not in expected_values:
+                        expected_values.append(row[symbol])
+                self.assertEqual(m.values(symbol), expected_values)
+
+                expected_rows = []
+                for row in expected:
+                    row = {k: v for k, v in row.items() if k == symbol}
+                    if row not in expected_rows:
+                        expected_rows.append(row)
+                self.assertEqual(list(m.project([symbol])), expected_rows)
+
+    # Test 8: List elements with literal fields are looked up, not matched against every data element
+    @responses.activate
+    def test_literal_index(self):
+        contacts = [{'type': 'borrower', 'name': 'name' + str(i)} for i in range(5000)]
+        contacts.insert(2500, {'type': 'contractor', 'name': 'bob'})
+        template = {'contacts': [{'type': 'contractor', 'name': S('name')}]}
+        compiled = compile(template)
+
+        element = compiled.root.items[0][1].elements[0]
+        tried = []
+        def counting_match(data, symbols, match=element.match):
+            tried.append(data)
+            return match(data, symbols)
+        element.match = counting_match
+
+        self.assertEqual(compiled.match_simple({'contacts': contacts}), [{S('name'): 'bob'}])
+        self.assertEqual(len(tried), 1)
+
+        class Unhashable(object):
+            __hash__ = None
+            def __init__(self, x):
+                self.x = x
+            def __eq__(self, other):
+                return getattr(other, 'x', None) == self.x
+
+        # Awkward values for the indexed fields; still the same results, in the same order, as match_simple
+        data = [{'k': 1, 'v': 'a'}, {'k': True, 'v': 'b'}, {'k': 1.0, 'v': 'c'}, {'k': '1', 'v': 'd'}, 'junk', None,
+                {'v': 'e'}, {'k': Unhashable(1), 'v': 'f'}, {'k': [1], 'v': 'g'}, ({'k': 1, 'v': 'h'}), {'k': (1,), 'v': 'i'}]
+        for literal in [1, '1', None, Unhashable(1), (1,)]:
+            for template in [[{'k': literal, 'v': S('v')}], [{'k': literal, 'v': S('v')}, {'k': 2, 'v': S('w')}],
+                             [Nullable({'k': literal, 'v': S('v')}), {'v': S('w')}]]:
+                try:
+                    expected = match_simple(template, data)
+                except NoMatchException:
+                    self.assertRaises(NoMatchException, compile(template).match_simple, data)
+                    continue
+                self.assertEqual(compile(template).match_simple(data), expected)
+
+    # Test 9: Asking for some symbols only looks at the parts of the data which can make a difference
+    @responses.activate
+    def test_projection_pushdown(self):
+        class CountingDict(dict):
+            lookups = 0
+            def __getitem__(self, key):
+                CountingDict.lookups += 1
+                return dict.__getitem__(self, key)
+
+        people = [CountingDict(name='name' + str(i), age=i) for i in range(10000)]
+        data = {'first': 'john', 'people': people, 'pets': [{'name': 'rex'}]}
+        template = {'first': S('first'), 'people': [{'name': S('name'), 'age': S('age')}],
+                    'pets': [{'name': S('pet')}], 'extra': Nullable({'kind': 'x'})}
+        m = match(template, data)
+        self.assertEqual(m['first'], {S('first'): 'john'})
+        self.assertEqual(CountingDict.lookups, 0)
+
+        # Constraints in unrequested parts still count
+        template = {'first': S('first'), 'people': [{'name': S('name'), 'age': 5000}]}
+        self.assertEqual(match(template, data)['first'], {S('first'): 'john'})
+        template = {'first': S('first'), 'people': [{'name': S('name'), 'age': -1}]}
+        self.assertRaises(NoMatchException, match(template, data).__getitem__, 'first')
+        self.assertRaises(NoMatchException, match_simple, template, data, [S('first')])
+        template = {'first': S('first'), 'pets': [{'name': S('pet')}, {'name': 'tom'}]}
+        self.assertRaises(NoMatchException, compile(template).match_simple, data, [S('first')])
+        data['pets'] = []
+        template = {'first': S('first'), 'pets': [S('pet')]}
+        self.assertRaises(NoMatchException, compile(template).match_simple, data, [S('first')])
+
+    # Test 10: Very wide and very deep templates
+    @responses.activate
+    def test_wide_and_deep(self):
+        n = 5000
+        template = {'field' + str(i): S('f' + str(i)) for i in range(n)}
+        m = match(template, {'field' + str(i): i for i in range(n)})
+        self.assertEqual(list(m), [{S('f' + str(i)): i for i in range(n)}])
+
+        template, data = S('leaf'), 'value'
+        for i in range(300):
+            template = {'level': template, 'id' + str(i): S('id' + str(i))}
+            data = {'level': data, 'id' + str(i): i}
+        rows = list(match(template, data))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0][S('leaf')], 'value')
+
+    # Test 11: Failures raise the same NoMatchException as match_simple, whichever way the engine finds out
+    @responses.activate
+    def test_failures(self):
+        def reverse(value):
+            if value == 'bad':
+                raise NoMatchException('bad value')
+            return value
+
+        failing = [
+            ({'kind': 'x', 'name': S('name')}, {'kind': 'y', 'name': 'a'}),
+            ({'people': [{'name': S('name'), 'info': {'kind': 'x'}}]}, {'people': [{'name': 'a', 'info': {'kind': 'y'}}]}),
+            ({'a': [{'b': [1]}]}, {'a': [{'b': [2]}, {'b': 3}]}),
+            ({'a': Trans(S('a'), identity, reverse)}, {'a': 'bad'}),
+            ([{'a': Trans(S('a'), identity, reverse)}], [{'a': 'bad'}, {'a': 'bad'}]),
+        ]
+        for template, data in failing:
+            with self.assertRaises(NoMatchException) as expected:
+                match_simple(template, data)
+            with self.assertRaises(NoMatchException) as actual:
+                compile(template).match_simple(data)
+            self.assertEqual(actual.exception.args, expected.exception.args)
+            self.assertFalse(can_match(template, data))
+
+        # Rejected by the reverse function, so that candidate just doesn't match
+        template = [{'a': Trans(S('a'), identity, reverse)}]
+        data = [{'a': 'bad'}, {'a': 'good'}]
+        self.assertEqual(compile(template).match_simple(data), [{S('a'): 'good', template[0]['a']: 'good'}])
+        self.assertEqual(compile(template).match_simple(data), match_simple(template, data))
+
+    # Test 12: Rows are enumerated as tuples against one schema, including rows which don't bind every symbol
+    @responses.activate
+    def test_compact_rows(self):
+        template = {'people': [{'name': S('name'), 'pet': Nullable({'kind': 'dog', 'name': S('dog')}),
+                                'ssn': Nullable({'kind': 'ssn', 'value': S('ssn')})}],
+                    'hats': [{'ssn': S('ssn'), 'color': S('color')}]}
+        data = {'people': [{'name': 'a', 'pet': {'kind': 'dog', 'name': 'rex'}, 'ssn': {'kind': 'ssn', 'value': 1}},
+                           {'name': 'b', 'pet': {'kind': 'cat', 'name': 'tom'}, 'ssn': {'kind': 'ssn', 'value': 2}},
+                           {'name': 'c', 'ssn': {'kind': 'other', 'value': 3}},
+                           {'name': 'd', 'pet': {'kind': 'dog', 'name': 'rex'}, 'ssn': {'kind': 'ssn', 'value': 1.0}}],
+                'hats': [{'ssn': 1, 'color': 'red'}, {'ssn': 2, 'color': 'blue'}, {'ssn': [3], 'color': 'green'}]}
+        m = match(template, data)
+        expected = match_simple(template, data)
+        self.assertEqual(list(m), expected)
+        self.assertEqual([list(row) for row in m], [list(row) for row in expected])  # same key order
+        self.assertEqual(m.count(), len(expected))
+
+        factors = m.factors
+        schema = factors.schema()
+        self.assertEqual(sorted(schema), sorted(m.compiled.symbols))
+        for row in factors.iter_rows():
+            self.assertEqual(type(row), tuple)
+            self.assertEqual(len(row), len(schema))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import responses
+from .compose import compose
+from .format import format
+from .match import match
+from .simple import NoMatchException
+from .symbol import S, Nullable, TransSymbol as Trans
+
+import random, unittest
+
+
+def two_step(match_a, format_c, match_c, format_b, data):
+    try:
+        return format(format_b, match(match_c, format(format_c, match(match_a, data))))
+    except NoMatchException:
+        return 'no match'
+
+
+def composed(composition, data):
+    try:
+        return composition.format(data)
+    except NoMatchException:
+        return 'no match'
+
+
+match_a = {'loan': {'id': S('id'), 'amount': S('amount'), 'kind': S('kind')},
+           'people': [{'name': S('name'), 'age': S('age')}], 'tags': [S('tag')]}
+
+# (format_c, match_c, format_b, whether the composition can skip C)
+cases = [
+    # Renames, restructuring and constants
+    ({'loanId': S('id'), 'money': {'amount': S('amount')}, 'version': 2},
+     {'loanId': S('c_id'), 'money': S('money'), 'version': S('version'), 'missing': S('missing')},
+     {'id': S('c_id'), 'money': S('money'), 'v': S('version'), 'm': S('missing')}, True),
+    ({'loanId': Trans(S('id'), str), 'codes': [7]},
+     {'loanId': Nullable(S('c_id')), 'codes': [S('code')]},
+     {'id': Trans(S('c_id'), lambda v: v + '!'), 'codes': [S('code')]}, True),
+    # Lists of records
+    ({'loan': S('id'), 'persons': [{'fullName': S('name'), 'years': S('age'), 'role': 'borrower'}]},
+     {'loan': S('c_id'), 'persons': [{'fullName': S('who'), 'years': S('years'), 'role': S('role')}]},
+     {'id': S('c_id'), 'borrowers': [{'name': S('who'), 'years': [S('years')], 'role': S('role')}],
+      'first': S('who')}, True),
+    # Literal selectors in match_c, which format_c's constants always satisfy
+    ({'loan': S('id'), 'persons': [{'name': S('name'), 'role': 'borrower'}], 'kind': 'loan'},
+     {'loan': S('c_id'), 'persons': [{'name': S('who'), 'role': 'borrower'}], 'kind': 'loan'},
+     {'id': S('c_id'), 'borrowers': [S('who')]}, True),
+    ({'first': S('name'), 'everyone': [{'name': S('name'), 'age': S('age')}], 'tags': [S('tag')]},
+     {'first': S('c_first'), 'everyone': [{'name': S('who'), 'age': S('years')}], 'tags': [S('c_tag')]},
+     [{'first': S('c_first'), 'who': S('who'), 'years': [S('years')]}, {'tag': S('c_tag')}], True),
+    # Fall back to building C: literals in match_c against A's data, lists which depend on each other, nested lists
+    ({'kind': S('kind'), 'id': S('id')}, {'kind': 'fixed', 'id': S('c_id')}, {'id': S('c_id')}, False),
+    ({'persons': [{'name': S('name')}], 'tags': [S('tag')]},
+     {'persons': [{'name': S('who')}], 'tags': [S('c_tag')]},
+     [{'who': S('who'), 'tags': [S('c_tag')]}], False),
+    ({'loans': [{'id': S('id'), 'people': [S('name')]}]}, {'loans': [{'id': S('c_id'), 'people': [S('who')]}]},
+     [{'id': S('c_id'), 'people': [S('who')]}], False),
+]
+
+
+class TestCompose(unittest.TestCase):
+    # Test 1: Same results as formatting into C and matching that, whether or not C is skipped
+    @responses.activate
+    def test_compose(self):
+        rnd = random.Random(0)
+        for format_c, match_c, format_b, direct in cases:
+            composition = compose(match_a, format_c, match_c, format_b)
+            self.assertEqual(composition.direct, direct)
+            for trial in range(20):
+                data = {'loan': {'id': rnd.randint(1, 3), 'amount': rnd.choice([100, 200]),
+                                 'kind': rnd.choice(['fixed', 'arm'])},
+                        'people': [{'name': rnd.choice(['al', 'bo', 'cy']), 'age': rnd.randint(20, 22)}
+                                   for i in range(rnd.randint(0, 6))],
+                        'tags': [rnd.choice(['x', 'y']) for i in range(rnd.randint(0, 3))]}
+                self.assertEqual(composed(composition, data), two_step(match_a, format_c, match_c, format_b, data))
+
+    # Test 2: Joins in A's template
+    @responses.activate
+    def test_joins(self):
+        match_a = {'names': [{'ssn': S('ssn'), 'name': S('name')}], 'hats': [{'ssn': S('ssn'), 'hat_color': S('color')}]}
+        format_c = {'people': [{'ssn': S('ssn'), 'name': S('name'), 'color': S('color')}]}
+        match_c = {'people': [{'name': S('who'), 'color': S('hat')}]}
+        format_b = [{'hat': S('hat'), 'names': [S('who')]}]
+        data = {'names': [{'ssn': 1, 'name': 'mario'}, {'ssn': 2, 'name': 'luigi'}, {'ssn': 3, 'name': 'peach'}],
+                'hats': [{'ssn': 1, 'hat_color': 'red'}, {'ssn': 2, 'hat_color': 'green'}, {'ssn': 3, 'hat_color': 'red'}]}
+        composition = compose(match_a, format_c, match_c, format_b)
+        self.assertFalse(composition.direct)
+        self.assertEqual(composition.format(data), [{'hat': 'red', 'names': ['mario', 'peach']},
+                                                    {'hat': 'green', 'names': ['luigi']}])
+
+
+if __name__ == '__main__':
+    unittest.main()
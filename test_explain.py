@@ -0,0 +1,52 @@
+import responses
+from .explain import explain
+from .match import compile, match
+from .symbol import S, Nullable
+
+import unittest
+
+
+contacts = [{'type': 'borrower', 'name': 'name' + str(i)} for i in range(20)] + [{'type': 'contractor', 'name': 'bob'}]
+data = {'contacts': contacts, 'pets': [{'name': 'rex'}, {'name': 'tom'}], 'first': 'john'}
+template = {'contacts': [{'type': 'contractor', 'name': S('contractor')}, Nullable({'name': S('name'), 'age': 5})],
+            'pets': [{'name': S('pet')}], 'first': S('first')}
+
+
+class TestExplain(unittest.TestCase):
+    # Test 1: Counts per template path
+    @responses.activate
+    def test_explain(self):
+        report = explain(template, data)
+        self.assertEqual(report.rows, 2)
+        self.assertIsNone(report.error)
+        stats = report.paths
+        self.assertEqual(stats[('', 'DictNode')].visits, 1)
+        # Looked up through the literal index, so only the contractor is tried
+        self.assertEqual(stats[('contacts[0]', 'DictNode')].visits, 1)
+        # Every contact is tried against the Nullable, and fails the age check
+        self.assertEqual(stats[('contacts[1]', 'NullableNode')].visits, 21)
+        self.assertEqual(stats[('contacts[1].age', 'LiteralNode')].failures, 21)
+        self.assertEqual(stats[('pets[0]', 'DictNode')].visits, 2)
+        self.assertEqual(report.totals()['candidates'], 1 + 21 + 2)
+        self.assertEqual(stats[('pets', 'ListNode')].rows_out, 2)
+        self.assertEqual(report.most_expensive(1)[0].path, '')
+        self.assertIn('contacts[1].age', str(report))
+
+    # Test 2: Re-matches by format, failed matches, and Match.stats()
+    @responses.activate
+    def test_explain_format(self):
+        report = explain(template, data, {'first': S('first'), 'pets': [{'pet': S('pet'), 'who': S('contractor')}]})
+        self.assertEqual(report.rematches, 2)
+
+        report = explain(compile(template), {'contacts': [], 'first': 'john'})
+        self.assertEqual(report.rows, None)
+        self.assertIsNotNone(report.error)
+        self.assertEqual(report.paths[('contacts', 'ListNode')].failures, 1)
+
+        stats = match(template, data).stats()
+        self.assertEqual(stats.rows, 2)
+        self.assertEqual(stats.paths[('contacts[0]', 'DictNode')].visits, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import responses
+from .format import format
+from .live import parse_path
+from .match import Match, match
+from .simple import NoMatchException
+from .symbol import S, Nullable, TransSymbol as Trans
+
+import random, unittest
+
+
+def outcome(f):
+    try:
+        return f()
+    except NoMatchException as e:
+        return 'no match: ' + str(e)
+
+
+class TestLive(unittest.TestCase):
+    # Test 1: Patching, and what stays the same
+    @responses.activate
+    def test_patch(self):
+        self.assertEqual(parse_path('contacts[3].phone'), ['contacts', 3, 'phone'])
+        self.assertEqual(parse_path(['a.b', 0]), ['a.b', 0])
+        self.assertEqual(parse_path(''), [])
+
+        data = {'app': {'id': 1}, 'contacts': [{'type': 'borrower', 'name': 'n' + str(i)} for i in range(20)]}
+        template = {'app': {'id': S('id')}, 'contacts': [{'type': 'contractor', 'name': S('name')}, {'name': S('all')}]}
+        output = {'id': S('id'), 'contractor': S('name'), 'names': [S('all')]}
+        m = match(template, data)
+        with self.assertRaises(NoMatchException):
+            format(output, m)
+
+        m.patch('contacts[5].type', 'contractor')
+        self.assertEqual(data['contacts'][5]['type'], 'contractor')
+        result = format(output, m)
+        self.assertEqual(result, {'id': 1, 'contractor': 'n5', 'names': ['n' + str(i) for i in range(20)]})
+        self.assertEqual(m.count(), 20)
+
+        # Patches which can't change any bindings leave everything format worked out as it was
+        indexes = dict(m.indexes)
+        m.patch('contacts[3].type', 'lender')
+        m.patch('app.notes', 'not in the template')
+        self.assertEqual(format(output, m), result)
+        self.assertEqual(len(indexes), 2)
+        for symbols, index in indexes.items():
+            self.assertIs(m.indexes[symbols], index)
+        m.patch(['contacts', 5, 'name'], 'bob')
+        self.assertEqual(format(output, m)['contractor'], 'bob')
+
+        m.patch('app', {'id': 2})
+        m.patch('contacts[-1]', {'type': 'contractor', 'name': 'last'})
+        self.assertEqual(list(m.project([S('id'), S('name')])), [{S('id'): 2, S('name'): 'bob'}, {S('id'): 2, S('name'): 'last'}])
+        m.patch('', {'app': {'id': 3}, 'contacts': {'type': 'contractor', 'name': 'only'}})
+        self.assertEqual(format(output, m), {'id': 3, 'contractor': 'only', 'names': ['only']})
+
+    # Test 2: A live match always agrees with matching the patched data from scratch
+    @responses.activate
+    def test_against_full_match(self):
+        rnd = random.Random(0)
+        def record(n):
+            return {'app': {'id': rnd.randint(0, 3), 'name': rnd.choice(['a', 'b', None])},
+                    'contacts': [{'type': rnd.choice(['borrower', 'contractor', 'x']), 'ssn': rnd.randint(0, 4),
+                                  'name': 'n' + str(rnd.randint(0, 5)), 'phone': rnd.choice([None, '1', '2'])}
+                                 for i in range(n)],
+                    'hats': [{'ssn': rnd.randint(0, 4), 'color': rnd.choice(['red', 'blue'])}
+                             for i in range(rnd.randint(0, 12))],
+                    'tags': [rnd.choice(['t1', 't2', 't3']) for i in range(rnd.randint(0, 10))]}
+        cases = [
+            ({'app': {'id': S('id')}, 'contacts': [{'type': 'contractor', 'name': S('cname'), 'phone': Nullable(S('phone'))}]},
+             {'id': S('id'), 'contractors': [{'name': S('cname'), 'phones': [S('phone')]}]}),
+            ({'contacts': [{'ssn': S('ssn'), 'name': S('name')}], 'hats': [{'ssn': S('ssn'), 'color': S('color')}]},
+             [{'name': S('name'), 'colors': [S('color')]}]),
+            ({'app': {'id': Trans(S('sid'), str, int)}, 'tags': [S('tag')],
+              'contacts': [{'type': 'borrower', 'ssn': S('ssn')}, {'type': 'x'}]},
+             {'sid': S('sid'), 'tags': [S('tag')], 'ssns': [S('ssn')]}),
+            ({'contacts': [{'type': 'borrower'}], 'hats': Nullable([{'color': 'red', 'ssn': S('red')}]), 'app': {'name': 'a'}},
+             {'reds': [S('red')]}),
+        ]
+        for trial in range(100):
+            template, output = cases[trial % len(cases)]
+            data = record(rnd.choice([3, 10, 20]))
+            m = match(template, data)
+            for step in range(6):
+                other = record(len(data['contacts']))
+                path = rnd.choice([['app', 'id'], ['app', 'name'], ['app'], ['tags'], ['hats']] +
+                                  [['contacts', i, key] for i in range(len(data['contacts']))
+                                   for key in ['type', 'name', 'ssn', 'phone']] +
+                                  [['contacts', i] for i in range(len(data['contacts']))] +
+                                  [['hats', i, 'ssn'] for i in range(len(data['hats']))] +
+                                  [['tags', i] for i in range(len(data['tags']))])
+                value = other
+                for key in path:
+                    value = value[key] if value is not None and (type(key) != int or key < len(value)) else None
+                m.patch(path, value)
+                fresh = Match(template, data)
+                self.assertEqual(outcome(lambda: list(m)), outcome(lambda: list(fresh)))
+                self.assertEqual(outcome(lambda: format(output, m)), outcome(lambda: format(output, fresh)))
+
+
+if __name__ == '__main__':
+    unittest.main()
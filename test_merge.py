@@ -0,0 +1,68 @@
+import responses
+from .merge import MergeException, merge
+from .symbol import S
+from .symbolic_address import SymbolicAddress
+
+from copy import deepcopy
+import unittest
+
+
+class TestMerge(unittest.TestCase):
+    # Test 1: A merge which doesn't match writes nothing
+    @responses.activate
+    def test_transactional(self):
+        target = {'owner': {}, 'loans': [{'id': 1}, {'id': 2, 'status': 'open'}]}
+        before = deepcopy(target)
+        with self.assertRaises(MergeException):
+            merge({'owner': {'name': 'bob'}, 'loans': [{'id': 2, 'status': 'closed'}]}, target)
+        self.assertEqual(target, before)
+
+        # A list item which writes into a target item, then fails on a later key, doesn't leave those writes behind
+        target = {'loans': [{'id': 1}, {'id': 2}]}
+        merge({'loans': [{'status': 'closed', 'id': 2}]}, target)
+        self.assertEqual(target, {'loans': [{'id': 1}, {'id': 2, 'status': 'closed'}]})
+
+        # Later items see what earlier ones wrote
+        target = [{'a': 1}]
+        with self.assertRaises(MergeException):
+            merge([{'b': 2}, {'b': 3}], target)
+        self.assertEqual(target, [{'a': 1}])
+        merge([{'b': 2}, {'b': 2, 'c': {'d': 4}}, {'c': {'e': 5}}], target)
+        self.assertEqual(target, [{'a': 1, 'b': 2, 'c': {'d': 4, 'e': 5}}])
+
+    # Test 2: Big target lists, merged through the index, come out as if every item had been tried in order
+    @responses.activate
+    def test_indexed(self):
+        n = 1000
+        target = {'loans': [{'id': i % 500 + 1, 'kind': 'big' if i % 2 else None} for i in range(n)]}
+        source = {'loans': [{'id': i + 1, 'kind': 'big', 'status': 'closed'} for i in range(0, 500, 7)] +
+                           [{'id': 5, 'kind': 'small'}, {'id': 1, 'extra': [1]}]}
+        merge(source, target)
+        expected = [{'id': i % 500 + 1, 'kind': 'big' if i % 2 else None} for i in range(n)]
+        for i in range(0, 500, 7):
+            # The first item with that id whose kind is 'big' or empty
+            expected[i].update(kind='big', status='closed')
+        expected[4]['kind'] = 'small'
+        expected[0]['extra'] = [1]
+        self.assertEqual(target['loans'][:500], expected[:500])
+        self.assertEqual(target['loans'][500:], expected[500:])
+
+        with self.assertRaises(MergeException):
+            merge({'loans': [{'id': 2, 'kind': 'small'}]}, target)
+
+    # Test 3: get_expansion over many symbolic addresses
+    @responses.activate
+    def test_expansion(self):
+        application = SymbolicAddress('application')
+        template = {'f' + str(i): getattr(application.profile, 'field' + str(i)) for i in range(300)}
+        template['primary'] = application.loans[{'kind': 'primary'}].amount
+        template['rate'] = application.loans[{'kind': 'primary'}].rate
+        expansion = SymbolicAddress.get_expansion(template)
+        self.assertEqual(len(expansion['application']['profile']), 300)
+        self.assertEqual(expansion['application']['loans'], [
+            {'kind': 'primary', 'amount': S("application.loans[{'kind': 'primary'}].amount"),
+             'rate': S("application.loans[{'kind': 'primary'}].rate")}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import responses
-from .simple import match_simple, format_simple
-from .symbol import S
+from .format import format, get_singles
+from .match import match
+from .simple import match_simple, format_simple, cartesian, get_symbols, unique
+from .symbol import Nullable, S, TransSymbol as Trans
 
 import unittest
 
@@ -90,5 +92,78 @@ class TestSimple(unittest.TestCase):
         m = match_simple(template, data, [S('u')])
         self.assertEqual(m, [{S('u'): 1}, {S('u'): 2}])
 
+    # Test 9: Join order and results are the same as a plain nested loop, including mixed symbol sets & unhashable values
+    @responses.activate
+    def test_cartesian_join(self):
+        def nested_loop(remainders, candidates):
+            result = []
+            for r in remainders:
+                for c in candidates:
+                    common = set(r).intersection(c)
+                    if all(r[k] == c[k] for k in common):
+                        result.append(dict(r, **c))
+            return result
+
+        a = [{'x': i % 3, 'y': i} for i in range(10)] + [{'z': [1]}, {'x': 1}]
+        b = [{'x': i % 4} for i in range(6)] + [{'x': 2, 'z': [1]}, {'w': 0}, {'z': [2]}]
+        self.assertEqual(cartesian([a, b]), nested_loop(b, a))
+        self.assertEqual(cartesian([b, a]), nested_loop(a, b))
+
+    # Test 10: Join on a shared symbol
+    @responses.activate
+    def test_join(self):
+        n = 2000
+        data = {'names': [{'ssn': i, 'name': 'name' + str(i)} for i in range(n)],
+                'hats': [{'ssn': n - i - 1, 'hat_color': 'color' + str(i)} for i in range(n)]}
+        template = {'names': [{'ssn': S('ssn'), 'name': S('name')}],
+                    'hats': [{'ssn': S('ssn'), 'hat_color': S('color')}]}
+
+        m = match_simple(template, data)
+        self.assertEqual(len(m), n)
+        self.assertEqual(m[0], {S('ssn'): n - 1, S('name'): 'name' + str(n - 1), S('color'): 'color0'})
+
+    # Test 11: Uniqueing nested, unhashable & TransSymbol-keyed matches, keeping first-seen order
+    @responses.activate
+    def test_unique_values(self):
+        class Unhashable(object):
+            __hash__ = None
+            def __init__(self, x):
+                self.x = x
+            def __eq__(self, other):
+                return self.x == other.x
+
+        t = Trans(S('t'))
+        matches = [{S('a'): {'b': [1, 2]}}, {S('a'): {'b': [1, 2]}}, {S('a'): {'b': (1, 2)}}, {S('a'): 1},
+                   {S('a'): 1.0}, {S('a'): Unhashable(1)}, {S('a'): Unhashable(1)}, {t: 'x'}, {S('a'): [{'c': {3}}]},
+                   {t: 'x'}, {S('a'): [{'c': frozenset([3])}]}, {S('a'): Unhashable(2)}, {S('b'): 1}]
+        self.assertEqual(unique(matches), [matches[i] for i in [0, 2, 3, 5, 7, 8, 11, 12]])
+
+    # Test 12: Uniqueing lots of matches
+    @responses.activate
+    def test_unique_many(self):
+        matches = [{S('a'): i % 1000, S('b'): [i % 7]} for i in range(100000)]
+        self.assertEqual(unique(matches), matches[:7000])
+
+    # Test 13: Symbol analysis, including on a big template
+    @responses.activate
+    def test_symbol_analysis(self):
+        template = {'a': S('a'), 'b': [{'c': S('c'), 'd': Nullable([S('d')])}], 'e': Trans(Nullable({'f': S('a')})), 'g': 1}
+        self.assertEqual(get_symbols(template), [S('a'), S('c'), S('d'), S('a')])
+        self.assertEqual(get_singles(template), [S('a'), S('a')])
+        self.assertEqual(get_symbols([S('x'), 2]), [S('x')])
+
+        n = 20000
+        big = {'k' + str(i): [{'v': S('v' + str(i))}] if i % 2 else S('v' + str(i)) for i in range(n)}
+        self.assertEqual(len(get_symbols(big)), n)
+        self.assertEqual(len(get_singles(big)), n // 2)
+        # Repeat calls hand out their own lists, and see changes to the template
+        get_symbols(big).append('junk')
+        self.assertEqual(len(get_symbols(big)), n)
+        changing = {'a': S('a')}
+        format(changing, match({'a': S('a'), 'b': S('b')}, {'a': 1, 'b': 2}))
+        changing['b'] = S('b')
+        self.assertEqual(get_symbols(changing), [S('a'), S('b')])
+        self.assertEqual(format(changing, match({'a': S('a'), 'b': S('b')}, {'a': 1, 'b': 2})), {'a': 1, 'b': 2})
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,77 @@
+import responses
+from .stream import iter_json_records, translate_stream, main
+from .symbol import S
+
+import io, json, os, tempfile, unittest
+
+
+match_template = {'kind': 'person', 'name': S('name'), 'pets': [{'name': S('pet')}]}
+format_template = {'owner': S('name'), 'pet_names': [S('pet')]}
+records = [{'kind': 'person', 'name': 'john', 'pets': [{'name': 'rex'}, {'name': 'tom'}], 'age': 12.5},
+           {'kind': 'robot', 'name': 'hal'},
+           {'kind': 'person', 'name': 'jane \\u2603 [x]', 'pets': [{'name': 'kitty'}]},
+           {'kind': 'person', 'name': 'abe', 'pets': {'name': 1234567}}]
+translated = [{'owner': 'john', 'pet_names': ['rex', 'tom']},
+              {'owner': 'jane \\u2603 [x]', 'pet_names': ['kitty']},
+              {'owner': 'abe', 'pet_names': [1234567]}]
+
+
+class TestStream(unittest.TestCase):
+    # Test 1: JSON lines and JSON arrays both parse incrementally, whatever the chunk boundaries
+    @responses.activate
+    def test_iter_json_records(self):
+        jsonl = '\n'.join(json.dumps(r) for r in records) + '\n'
+        array = ' [\n' + ',\n  '.join(json.dumps(r) for r in records) + '\n]\n'
+        for text in [jsonl, array, '[1, 23, 456, true]', '7\n89\n']:
+            expected = records if text in (jsonl, array) else json.loads(text if text[0] == '[' else '[7, 89]')
+            for chunk_size in [1, 2, 3, 7, 64, 65536]:
+                self.assertEqual(list(iter_json_records(io.StringIO(text), chunk_size)), expected)
+        self.assertEqual(list(iter_json_records(io.StringIO('[]'))), [])
+        self.assertEqual(list(iter_json_records(io.StringIO(''))), [])
+        with self.assertRaises(ValueError):
+            list(iter_json_records(io.StringIO('[1, 2'), 2))
+        # Exactly one , or ] after each element, and nothing but whitespace after the array
+        for text in ['[1 2]', '[1,,2]', '[1,]', '[1]x', '[1] [2]']:
+            for chunk_size in [1, 2, 65536]:
+                with self.assertRaises(ValueError):
+                    list(iter_json_records(io.StringIO(text), chunk_size))
+        self.assertEqual(list(iter_json_records(io.StringIO('[ 1 ,2 ] \n'), 1)), [1, 2])
+        self.assertEqual(list(iter_json_records(io.StringIO('[1.5, -2e10]'), 2)), [1.5, -2e10])
+
+        # A malformed record is an error right away, not once the rest of the file has been read
+        rest = ''.join(json.dumps(r) + '\n' for r in records * 1000)
+        for text in ['{"a": 1}\n{"a": tru}\n' + rest, '[{"a": 1}, {"a": tru},\n' + rest.replace('\n', ',')]:
+            infile = io.StringIO(text)
+            with self.assertRaises(ValueError):
+                list(iter_json_records(infile, 64))
+            self.assertLess(infile.tell(), 1000)
+
+    # Test 2: Records which don't match go to the error output
+    @responses.activate
+    def test_translate_stream(self):
+        for workers in [0, 2]:
+            infile = io.StringIO(json.dumps(records))
+            outfile, errfile = io.StringIO(), io.StringIO()
+            counts = translate_stream(match_template, format_template, infile, outfile, errfile, max_workers=workers)
+            self.assertEqual(counts, (3, 1))
+            self.assertEqual([json.loads(line) for line in outfile.getvalue().splitlines()], translated)
+            self.assertEqual([json.loads(line) for line in errfile.getvalue().splitlines()], [records[1]])
+
+    # Test 3: Command line entry point
+    @responses.activate
+    def test_main(self):
+        directory = tempfile.mkdtemp()
+        paths = {name: os.path.join(directory, name) for name in ['in.jsonl', 'out.jsonl', 'err.jsonl']}
+        with open(paths['in.jsonl'], 'w') as f:
+            f.write('\n'.join(json.dumps(r) for r in records))
+
+        main([__name__ + ':match_template', __name__ + ':format_template', paths['in.jsonl'],
+              '-o', paths['out.jsonl'], '--errors', paths['err.jsonl']])
+        with open(paths['out.jsonl']) as f:
+            self.assertEqual([json.loads(line) for line in f], translated)
+        with open(paths['err.jsonl']) as f:
+            self.assertEqual([json.loads(line) for line in f], [records[1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
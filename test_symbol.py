@@ -0,0 +1,72 @@
+import responses
+from .codegen import codegen
+from .format import format
+from .match import match
+from .symbol import S, TransSymbol as Trans
+
+import pickle, unittest
+
+
+class Counter(object):
+    # A transformation which records the values it's called with
+    def __init__(self, function):
+        self.function = function
+        self.calls = []
+
+    def __call__(self, values):
+        self.calls.append(values)
+        return self.function(values)
+
+
+class TestTransSymbol(unittest.TestCase):
+    # Test 1: Cached forward functions and dict maps give the same results as before, with fewer calls
+    @responses.activate
+    def test_cache(self):
+        double = Counter(lambda v: v * 2)
+        trans = Trans(S('x'), double, cache=2)
+        self.assertEqual([trans._forward(v) for v in [1, 1, 2, 1, True, [3], None]], [2, 2, 4, 2, 2, [3, 3], None])
+        # 1 and True are cached separately; unhashable values aren't cached; None fails (once), as usual
+        self.assertEqual(double.calls, [1, 2, True, [3], None])
+        # Least recently used goes first
+        trans._forward(3)
+        trans._forward(1)
+        self.assertEqual(double.calls[-1], 1)
+
+        # The cache isn't pickled, but the transformation is
+        copy = pickle.loads(pickle.dumps(Trans(S('x'), str, cache=10)))
+        self.assertEqual(copy._forward(5), '5')
+
+        codes = Trans(S('x'), {'F': 'fixed', 'A': 'arm'})
+        self.assertEqual([codes._forward(v) for v in ['F', 'Z', None, ['F']]], ['fixed', None, None, ['F']])
+        self.assertEqual(codes._reverse('arm'), 'A')
+
+    # Test 2: Vectorized functions get all of a list's values at once
+    @responses.activate
+    def test_vectorized(self):
+        upper = Counter(lambda values: [v.upper() for v in values])
+        double = Counter(lambda values: values * 2)
+        match_template = {'id': S('id'), 'people': [{'name': S('name'), 'age': S('age')}]}
+        data = {'id': 7, 'people': [{'name': 'al', 'age': 30}, {'name': 'bo', 'age': 40}, {'name': 'al', 'age': 50}]}
+        template = {'id': Trans(S('id'), vectorized=double),
+                    'people': [{'name': Trans(S('name'), vectorized=upper), 'age': Trans(S('age'), vectorized=double),
+                                'initial': Trans(Trans(S('name'), vectorized=upper), lambda name: name[0])}]}
+        expected = {'id': 14, 'people': [{'name': 'AL', 'age': 60, 'initial': 'A'},
+                                         {'name': 'BO', 'age': 80, 'initial': 'B'},
+                                         {'name': 'AL', 'age': 100, 'initial': 'A'}]}
+        self.assertEqual(format(template, match(match_template, data)), expected)
+        self.assertEqual([list(values) for values in double.calls], [[7], [30, 40, 50]])
+        self.assertEqual(upper.calls, [['al', 'bo', 'al'], ['al', 'bo', 'al']])
+        self.assertEqual(type(format(template, match(match_template, data))['id']), int)
+
+        # One value at a time, where format() doesn't have a whole list
+        self.assertEqual(format({'name': Trans(S('name'), vectorized=upper)}, {'name': 'cy'}), {'name': 'CY'})
+        self.assertEqual(upper.calls[-1], ['cy'])
+
+        # Generated code would call it once per value, so that goes through the engine
+        translate = codegen(match_template, template)
+        self.assertFalse(translate.specialized)
+        self.assertEqual(translate(data), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
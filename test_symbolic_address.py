@@ -84,3 +84,46 @@ class TestSymbolicAddress(unittest.TestCase):
         #m = match(template, one_way)
         #other_way = SymbolicAddress.reverse_format(template, m)
         #self.assertEqual(other_way, data)
+
+    @responses.activate
+    def test_bulk_resolution(self):
+        class CountingDict(dict):
+            lookups = 0
+            def __getitem__(self, key):
+                CountingDict.lookups += 1
+                return dict.__getitem__(self, key)
+
+        application = SymbolicAddress('application')
+        data = {'application': CountingDict(profile={'field' + str(i): i for i in range(200)})}
+        template = {'f' + str(i): getattr(application.profile, 'field' + str(i)) for i in range(200)}
+        template['missing'] = application.other.thing
+        template['whole'] = application.profile
+
+        result = format(template, data)
+        # i.e. one match for all the leaf addresses plus one for application.profile itself, rather than one per address
+        self.assertEqual(CountingDict.lookups, 3)
+        expected = {'f' + str(i): i for i in range(200)}
+        expected.update({'missing': None, 'whole': {'field' + str(i): i for i in range(200)}})
+        self.assertEqual(result, expected)
+
+    @responses.activate
+    def test_interning(self):
+        a = SymbolicAddress('a')
+        # Same chain, same object; and the path is only built once
+        self.assertIs(a.b.c, a.b.c)
+        self.assertIs(a.b[{'kind': 'x'}].d, a.b[{'kind': 'x'}].d)
+        self.assertIsNot(a.b[{'kind': 'x'}], a.b[{'kind': 'y'}])
+        self.assertIs(a.b.c._path, a.b.c._path)
+
+        self.assertEqual(a.b.c._path, {'b': {'c': S('a.b.c')}})
+        self.assertEqual(a.b[{'kind': 'x'}].d.e._path, {'b': [{'kind': 'x', 'd': {'e': S("a.b[{'kind': 'x'}].d.e")}}]})
+        # Building a child doesn't change its parent's path
+        self.assertEqual(a.b._path, {'b': S('a.b')})
+        # Children belong to their parent: same names, different paths
+        self.assertEqual(SymbolicAddress('app').x._path, {'x': S('app.x')})
+        self.assertEqual(SymbolicAddress('app', 'app', {'wrapper': S('app')}).x._path, {'wrapper': {'x': S('app.x')}})
+        # Probes for special or private attributes aren't kept
+        self.assertFalse(hasattr(a.b, '__html__'))
+        self.assertEqual(a.b._id._path, {'b': {'_id': S('a.b._id')}})
+        self.assertNotIn('_id', a.b._children)
+        self.assertNotIn('__html__', a.b._children)